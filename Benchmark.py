@@ -0,0 +1,441 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import matplotlib
+
+matplotlib.use("Agg")  # figures are rendered off-screen, never shown
+
+import numpy as np
+import pandas as pd
+
+from BetweenCountry import (calculate_growth_rate, compute_country_correlation_matrices,
+                            index_rename_and_calculate_growth_rate, load_and_merge_data, plot_correlation_heatmap)
+from DataProcess import (olympic_hosts, preprocess_csv_type1, preprocess_csv_type2, preprocess_csv_type3,
+                         preprocess_csv_type3_batch, preprocess_special_csv)
+
+
+# Timing and memory benchmarks of the load -> growth -> correlation -> plot stages.
+# Every stage runs `repeat` times for the wall time (best and median) and once more under tracemalloc
+# for the peak of Python/numpy allocations. The loaders are called without DataCache, so the on-disk
+# preprocess cache never hides their cost.
+# Two suites: 'bundled' on the csvs in data/, 'synthetic' on generated files of synthetic_scale size.
+# Results are written as JSON to BENCHMARK_DIR; compare_results diffs two runs (e.g. two commits).
+
+BENCHMARK_DIR = os.environ.get('OLYMPIC_BENCHMARK_DIR', os.path.join('.cache', 'benchmarks'))
+synthetic_scale = {"countries": 265, "years": 60, "indicators": 50, "figures": 8}
+regression_tolerance = 0.10  # relative slowdown / memory growth reported as a regression
+
+
+def measure(func, *args, repeat=3, **kwargs):
+    """
+    Wall time and peak traced memory of func(*args, **kwargs).
+
+    :param func: callable to measure
+    :param repeat: number of timed calls (one extra call runs under tracemalloc)
+    :return: dict with best_s, median_s, peak_mb and rows (len of the result, when it has one)
+
+    >>> result = measure(sorted, list(range(1000)), repeat=2)
+    >>> sorted(result), result['rows']
+    (['best_s', 'median_s', 'peak_mb', 'rows'], 1000)
+    """
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "best_s": min(timings),
+        "median_s": float(np.median(timings)),
+        "peak_mb": peak / 1024 ** 2,
+        "rows": len(result) if hasattr(result, "__len__") else None,
+    }
+
+
+def write_synthetic_worldbank(file_path, countries=265, years=60, indicators=1, seed=0):
+    """
+    Write a World Bank style wide csv (4 preamble lines, one column per year) with random walks.
+
+    :param file_path: csv file to write
+    :param countries: number of countries; the olympic hosts come first, then 'Country 1', 'Country 2', ...
+    :param years: number of year columns, starting in 1960
+    :param indicators: number of indicators (rows per country)
+    :param seed: seed for numpy's default_rng
+    :return: list of country names
+    """
+    rng = np.random.default_rng(seed)
+    names = list(olympic_hosts)[:countries]
+    names += [f"Country {i}" for i in range(1, countries - len(names) + 1)]
+    year_columns = [str(1960 + i) for i in range(years)]
+
+    steps = rng.normal(0.02, 0.05, size=(countries * indicators, years))
+    values = 100 * np.exp(np.cumsum(steps, axis=1))
+    df = pd.DataFrame(values, columns=year_columns)
+    df.insert(0, "Country Name", np.repeat(names, indicators))
+    df.insert(1, "Country Code", np.repeat([f"C{i:03d}" for i in range(countries)], indicators))
+    df.insert(2, "Indicator Name", np.tile([f"Indicator {k}" for k in range(indicators)], countries))
+    df.insert(3, "Indicator Code", np.tile([f"IND.{k}" for k in range(indicators)], countries))
+
+    with open(file_path, "w", newline="") as file:
+        file.write('"Data Source","World Development Indicators",\n\n"Last Updated Date","2024-11-13",\n\n')
+        df.to_csv(file, index=False, float_format="%.6f")
+    return names
+
+
+def write_synthetic_who(file_path, countries=265, years=60, seed=0):
+    """
+    Write a WHO style long csv (Location, Period, Dim1, 'value [lower-upper]') for preprocess_csv_type2.
+
+    :param file_path: csv file to write
+    :param countries: number of countries (olympic hosts first)
+    :param years: number of periods, starting in 1960
+    :param seed: seed for numpy's default_rng
+    :return: list of country names
+    """
+    rng = np.random.default_rng(seed)
+    names = list(olympic_hosts)[:countries]
+    names += [f"Country {i}" for i in range(1, countries - len(names) + 1)]
+    sexes = ["Both sexes", "Female", "Male"]
+
+    n = countries * years * len(sexes)
+    value = rng.uniform(1, 40, size=n)
+    df = pd.DataFrame({
+        "Location": np.repeat(names, years * len(sexes)),
+        "Period": np.tile(np.repeat(np.arange(1960, 1960 + years), len(sexes)), countries),
+        "Dim1": np.tile(sexes, countries * years),
+        "Value": [f"{v:.1f} [{v * 0.8:.1f}-{v * 1.2:.1f}]" for v in value],
+    })
+    df.to_csv(file_path, index=False)
+    return names
+
+
+def synthetic_growth_data(countries=265, years=60, indicators=50, seed=0):
+    """
+    Cleaned data of every indicator and country, as returned by the growth step.
+
+    :return: dict of indicator -> {country key: DataFrame with 'Relative Year' and the indicator}
+    """
+    rng = np.random.default_rng(seed)
+    relative_years = np.arange(years) - years // 2
+    values = 100 * np.exp(np.cumsum(rng.normal(0.02, 0.05, size=(indicators, countries, years)), axis=2))
+    return {f"Indicator_{k}": {f"C{c:03d}": pd.DataFrame({"Relative Year": relative_years,
+                                                          f"Indicator_{k}": values[k, c]})
+                               for c in range(countries)}
+            for k in range(indicators)}
+
+
+def _uncached(loader):
+    """The loader without the on-disk preprocess cache (see DataCache.cached_preprocess)."""
+    return getattr(loader, "uncached", loader)
+
+
+def _growth_per_country(series, indicator):
+    """index_rename_and_calculate_growth_rate on every (frame, host year) pair, as the notebooks call it."""
+    return [index_rename_and_calculate_growth_rate(df.copy(), host_year=host_year, metric_column=indicator)
+            for df, host_year in series]
+
+
+def _render_heatmaps(matrices, output_dir, figures):
+    paths = []
+    for country, groups in matrices.items():
+        for group, matrix in groups.items():
+            if len(paths) == figures:
+                return paths
+            path = os.path.join(output_dir, f"heatmap_{len(paths)}.png")
+            plot_correlation_heatmap(matrix, title=f"{group} ({country})", save_path=path)
+            paths.append(path)
+    return paths
+
+
+def bundled_stages(data_dir="data", output_dir=None):
+    """
+    Benchmark stages on the csv files bundled in data_dir.
+
+    :param data_dir: folder with the study's csv files
+    :param output_dir: folder for the rendered figures
+    :return: list of (stage name, func, args, kwargs)
+    """
+    hosts = list(olympic_hosts)
+    ranges = {host: (year - 5, year + 5) for host, year in olympic_hosts.items()}
+    gdp = os.path.join(data_dir, "GDP.csv")
+    stages = [
+        ("preprocess_csv_type1", _uncached(preprocess_csv_type1),
+         (os.path.join(data_dir, "GDP_KOR.csv"), "Date", "Date", (1983, 1993)), {"skip_rows": 7}),
+        ("preprocess_csv_type3", _uncached(preprocess_csv_type3),
+         (gdp, "Country Name", hosts, "Year", (1971, 2017)), {"skip_rows": 3}),
+        ("preprocess_csv_type3_batch", _uncached(preprocess_csv_type3_batch),
+         (gdp, "Country Name", ranges, "Year"), {"skip_rows": 3}),
+        ("preprocess_special_csv", _uncached(preprocess_special_csv),
+         (os.path.join(data_dir, "Unemployment_rate_China.csv"), "Year", (2003, 2013)), {"skip_rows": 2}),
+    ]
+
+    # downstream stages work on the real GDP series of every host
+    loaded = _uncached(preprocess_csv_type3_batch)(gdp, "Country Name", ranges, "Year", skip_rows=3)
+    series = [(loaded[host].rename(columns={"Value": "GDP"}), olympic_hosts[host]) for host in hosts]
+    growth = dict(zip(hosts, _growth_per_country(series, "GDP")))
+    cleaned = {"GDP": growth, "Growth Rate (%)": growth}
+    long = pd.concat([df.assign(Country=host) for host, df in loaded.items()], ignore_index=True)
+    merged = load_and_merge_data(cleaned)
+    suffixes = {host: f"_{host}" for host in hosts}
+    groups = {"Economic": ["GDP", "Growth Rate (%)"]}
+    matrices = compute_country_correlation_matrices(merged, groups, suffixes, verbose=False)
+
+    stages += [
+        ("calculate_growth_rate", calculate_growth_rate, (long.copy(), "Value"), {"group_column": "Country"}),
+        ("index_rename_and_calculate_growth_rate", _growth_per_country, (series, "GDP"), {}),
+        ("load_and_merge_data", load_and_merge_data, (cleaned,), {}),
+        ("compute_country_correlation_matrices", compute_country_correlation_matrices,
+         (merged, groups, suffixes), {"verbose": False}),
+        ("render_heatmaps", _render_heatmaps, (matrices, output_dir, len(hosts)), {}),
+    ]
+    return stages
+
+
+def synthetic_stages(work_dir, countries=265, years=60, indicators=50, figures=8, seed=0):
+    """
+    Benchmark stages on generated files and frames (default: synthetic_scale).
+
+    :param work_dir: folder for the generated csv files and rendered figures
+    :return: list of (stage name, func, args, kwargs)
+    """
+    wide = os.path.join(work_dir, "synthetic_worldbank.csv")
+    who = os.path.join(work_dir, "synthetic_who.csv")
+    names = write_synthetic_worldbank(wide, countries, years, indicators, seed)
+    write_synthetic_who(who, countries, years, seed)
+    last_year = 1960 + years - 1
+    ranges = {name: (1960, last_year) for name in names}
+
+    cleaned = synthetic_growth_data(countries, years, indicators, seed)
+    metrics = list(cleaned)
+    groups = {f"Group {g}": metrics[g::5] for g in range(min(5, len(metrics)))}
+    suffixes = {key: f"_{key}" for key in next(iter(cleaned.values()))}
+    merged = load_and_merge_data(cleaned)
+    matrices = compute_country_correlation_matrices(merged, groups, suffixes, verbose=False)
+
+    long = pd.concat([df.rename(columns={metric: "Value"}).assign(Series=f"{key}/{metric}")
+                      for metric, frames in cleaned.items() for key, df in frames.items()], ignore_index=True)
+    first = cleaned[metrics[0]]
+
+    return [
+        ("preprocess_csv_type2", _uncached(preprocess_csv_type2),
+         (who, "Location", names, "Period", (1960, last_year)), {}),
+        ("preprocess_csv_type3", _uncached(preprocess_csv_type3),
+         (wide, "Country Name", names, "Year", (1960, last_year)), {"skip_rows": 4}),
+        ("preprocess_csv_type3_batch", _uncached(preprocess_csv_type3_batch),
+         (wide, "Country Name", ranges, "Year"), {"skip_rows": 4}),
+        ("calculate_growth_rate", calculate_growth_rate, (long, "Value"),
+         {"group_column": "Series"}),
+        ("index_rename_and_calculate_growth_rate", _growth_per_country,
+         ([(df.rename(columns={"Relative Year": "Year"}), 0) for df in first.values()], metrics[0]), {}),
+        ("load_and_merge_data", load_and_merge_data, (cleaned,), {}),
+        ("compute_country_correlation_matrices", compute_country_correlation_matrices,
+         (merged, groups, suffixes), {"verbose": False}),
+        ("render_heatmaps", _render_heatmaps, (matrices, work_dir, figures), {}),
+    ]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(suites=("bundled", "synthetic"), repeat=3, data_dir="data", scale=None, stages=None):
+    """
+    Run the benchmark suites.
+
+    :param suites: 'bundled' and/or 'synthetic'
+    :param repeat: timed calls per stage
+    :param data_dir: folder with the bundled csv files
+    :param scale: overrides of synthetic_scale, e.g. {'countries': 50}
+    :param stages: only run these stage names (default: all)
+    :return: dict with 'meta' (commit, versions, time) and 'results' (one record per suite and stage)
+    """
+    scale = {**synthetic_scale, **(scale or {})}
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for suite in suites:
+            if suite == "bundled":
+                suite_stages = bundled_stages(data_dir, work_dir)
+            elif suite == "synthetic":
+                suite_stages = synthetic_stages(work_dir, **scale)
+            else:
+                raise ValueError(f"Unknown benchmark suite '{suite}', use 'bundled' or 'synthetic'.")
+
+            for name, func, args, kwargs in suite_stages:
+                if stages and name not in stages:
+                    continue
+                record = {"suite": suite, "stage": name}
+                try:
+                    record.update(measure(func, *args, repeat=repeat, **kwargs))
+                except Exception as error:  # a broken stage is reported, the others still run
+                    print(f"Warning: benchmark {suite}/{name} failed: {error!r}")
+                    record["error"] = repr(error)
+                results.append(record)
+                if "error" not in record:
+                    print(f"{suite:>9} {name:<40} {record['best_s'] * 1000:10.1f} ms {record['peak_mb']:9.1f} MB")
+
+    meta = {
+        "commit": _git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "suites": list(suites),
+        "scale": scale,
+    }
+    return {"meta": meta, "results": results}
+
+
+def save_results(report, path=None):
+    """
+    Write a run_benchmarks report as JSON (default: BENCHMARK_DIR/<time>_<commit>.json).
+
+    :return: path of the written file
+    """
+    if path is None:
+        stamp = report["meta"]["created"].replace(":", "").replace("-", "")[:15]
+        path = os.path.join(BENCHMARK_DIR, f"{stamp}_{report['meta']['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+    return path
+
+
+def load_results(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def _suites(report):
+    return sorted(report.get("meta", {}).get("suites") or {record["suite"] for record in report["results"]})
+
+
+def check_comparable(baseline, current):
+    """
+    Refuse to compare reports whose timings measure different work: other suites, or another
+    synthetic scale when the synthetic suite ran. Other settings (repeat, machine, library versions)
+    only print a Warning, since they add noise rather than change the work.
+
+    :raises ValueError: on a suite or scale mismatch
+
+    >>> meta = {'suites': ['synthetic'], 'scale': {'countries': 265}, 'repeat': 3, 'machine': 'x86_64'}
+    >>> small = {'results': [], 'meta': {**meta, 'scale': {'countries': 30}, 'repeat': 1}}
+    >>> check_comparable({'results': [], 'meta': meta}, small)
+    Traceback (most recent call last):
+    ...
+    ValueError: Benchmark reports are not comparable: synthetic scale {'countries': 265} vs {'countries': 30}.
+    >>> check_comparable({'results': [], 'meta': meta}, {'results': [], 'meta': {**meta, 'repeat': 1}})
+    Warning: benchmark reports differ in repeat (3 vs 1), timings are noisier to compare.
+    """
+    old_meta, new_meta = baseline.get("meta", {}), current.get("meta", {})
+    problems = []
+    if _suites(baseline) != _suites(current):
+        problems.append(f"suites {_suites(baseline)} vs {_suites(current)}")
+    if "synthetic" in _suites(current) and old_meta.get("scale") != new_meta.get("scale"):
+        problems.append(f"synthetic scale {old_meta.get('scale')} vs {new_meta.get('scale')}")
+    if problems:
+        raise ValueError(f"Benchmark reports are not comparable: {'; '.join(problems)}.")
+
+    for key in ("repeat", "machine", "python", "pandas", "numpy"):
+        if key in old_meta and key in new_meta and old_meta[key] != new_meta[key]:
+            print(f"Warning: benchmark reports differ in {key} ({old_meta[key]} vs {new_meta[key]}), "
+                  f"timings are noisier to compare.")
+
+
+def compare_results(baseline, current, tolerance=regression_tolerance):
+    """
+    Compare two benchmark reports stage by stage, after check_comparable.
+
+    :param baseline: report (dict from run_benchmarks / load_results) of the reference commit
+    :param current: report of the commit under test
+    :param tolerance: relative change of best time or peak memory below which a stage is 'ok'
+    :return: DataFrame with both timings and peaks, their ratios (current / baseline) and a status
+             ('regression', 'improvement', 'ok', or 'missing' when a stage ran only once)
+    :raises ValueError: when the reports ran other suites or another synthetic scale
+
+    >>> baseline = {'results': [{'suite': 's', 'stage': 'load', 'best_s': 1.0, 'peak_mb': 10.0},
+    ...                         {'suite': 's', 'stage': 'plot', 'best_s': 2.0, 'peak_mb': 5.0}]}
+    >>> current = {'results': [{'suite': 's', 'stage': 'load', 'best_s': 0.5, 'peak_mb': 10.0},
+    ...                        {'suite': 's', 'stage': 'plot', 'best_s': 2.0, 'peak_mb': 8.0}]}
+    >>> compare_results(baseline, current)[['stage', 'time_ratio', 'memory_ratio', 'status']]
+      stage  time_ratio  memory_ratio       status
+    0  load         0.5           1.0  improvement
+    1  plot         1.0           1.6   regression
+    """
+    check_comparable(baseline, current)
+
+    def table(report):
+        rows = [record for record in report["results"] if "error" not in record]
+        return pd.DataFrame(rows, columns=["suite", "stage", "best_s", "peak_mb"]).set_index(["suite", "stage"])
+
+    merged = table(baseline).join(table(current), how="outer", lsuffix="_baseline", rsuffix="_current", sort=False)
+    merged["time_ratio"] = merged["best_s_current"] / merged["best_s_baseline"]
+    merged["memory_ratio"] = merged["peak_mb_current"] / merged["peak_mb_baseline"]
+
+    worst = merged[["time_ratio", "memory_ratio"]].max(axis=1)
+    best = merged[["time_ratio", "memory_ratio"]].min(axis=1)
+    merged["status"] = np.select(
+        [merged[["time_ratio", "memory_ratio"]].isna().any(axis=1), worst > 1 + tolerance, best < 1 - tolerance],
+        ["missing", "regression", "improvement"], default="ok")
+    return merged.reset_index()
+
+
+def main(argv=None):
+    """
+    Command line entry point.
+
+    Example: python Benchmark.py --suite synthetic --countries 100 --compare .cache/benchmarks/<baseline>.json
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the load, growth, correlation and plot stages.")
+    parser.add_argument("--suite", nargs="+", default=["bundled", "synthetic"], choices=["bundled", "synthetic"])
+    parser.add_argument("--repeat", type=int, default=3, help="timed calls per stage")
+    parser.add_argument("--data-dir", default="data", help="folder with the bundled csv files")
+    parser.add_argument("--stage", nargs="+", help="only run these stages")
+    for key, value in synthetic_scale.items():
+        parser.add_argument(f"--{key}", type=int, default=value, help=f"synthetic suite size (default {value})")
+    parser.add_argument("--output", help="results file (default: a new file in BENCHMARK_DIR)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=regression_tolerance)
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 on a regression")
+    args = parser.parse_args(argv)
+
+    scale = {key: getattr(args, key) for key in synthetic_scale}
+    report = run_benchmarks(args.suite, args.repeat, args.data_dir, scale, args.stage)
+    print(f"Results written to {save_results(report, args.output)}")
+
+    if args.compare:
+        try:
+            comparison = compare_results(load_results(args.compare), report, args.tolerance)
+        except ValueError as error:  # not a regression: rerun with the baseline's --suite and scale
+            print(f"Warning: {error} Stages not compared.")
+            return report
+        print(comparison.to_string(index=False, float_format="{:.3f}".format))
+        if args.fail_on_regression and (comparison["status"] == "regression").any():
+            raise SystemExit(1)
+    return report
+
+
+if __name__ == '__main__':
+    main()
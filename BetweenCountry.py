@@ -1,15 +1,30 @@
-import matplotlib.pyplot as plt
-import pandas as pd
-import seaborn as sns
+import argparse
+import hashlib
+import os
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+import pandas as pd
 
-def calculate_growth_rate(df, metric_column):
+from Profiling import profiled, stage
+
+
+@profiled
+def calculate_growth_rate(df, metric_column, group_column=None, invalid_value=0):
     """
     Calculate the growth rate for GDP or FDI per year.
 
-    :param df: a cleaned dataframe
+    Works on the whole column at once. With group_column, the growth rate of many countries
+    (or country/indicator series) is computed in one pass, each group starting from its own first row.
+
+    :param df: a cleaned dataframe, rows in year order (within each group)
     :param metric_column: the GDP/FDI column
+    :param group_column: column (or list of columns) identifying separate series, e.g. 'Country'
+    :param invalid_value: value used for the first row, a zero previous year or non-numeric values
+                          (0 keeps the original behaviour, np.nan marks them as missing instead)
     :return: DataFrame with an additional column 'Growth Rate (%)'
         Example:
     >>> import pandas as pd
@@ -17,26 +32,43 @@ def calculate_growth_rate(df, metric_column):
     >>> df = pd.DataFrame(data)
     >>> calculate_growth_rate(df, 'GDP')
        Year   GDP  Growth Rate (%)
-    0  2000  1000         0.000000
-    1  2001  1100        10.000000
-    2  2002  1210        10.000000
-    """
-    growth_rates = [0]
+    0  2000  1000              0.0
+    1  2001  1100             10.0
+    2  2002  1210             10.0
 
-    for i in range(1, len(df)):
-        previous_year = df.loc[i - 1, metric_column]  # row:i-1, col: metric
-        current_year = df.loc[i, metric_column]
+    >>> data = {'Country': ['A', 'A', 'B', 'B'], 'GDP': [100, 110, 0, 50]}
+    >>> df = pd.DataFrame(data)
+    >>> calculate_growth_rate(df, 'GDP', group_column='Country', invalid_value=np.nan)
+      Country  GDP  Growth Rate (%)
+    0       A  100              NaN
+    1       A  110             10.0
+    2       B    0              NaN
+    3       B   50              NaN
+    """
+    raw_values = df[metric_column]
+    values = pd.to_numeric(raw_values, errors='coerce').astype('float64')
+    non_numeric = values.isna() & raw_values.notna()  # e.g. strings, which used to give 0
+
+    if group_column is None:
+        previous = values.shift(1)
+        previous_non_numeric = non_numeric.shift(1, fill_value=False)
+        first_row = pd.Series(False, index=df.index)
+        first_row.iloc[:1] = True
+    else:
+        groups = df[group_column]
+        previous = values.groupby(groups, sort=False).shift(1)
+        previous_non_numeric = non_numeric.groupby(groups, sort=False).shift(1, fill_value=False)
+        first_row = values.groupby(groups, sort=False).cumcount() == 0
 
-        if previous_year == 0 or not isinstance(current_year, (int, float)) or not isinstance(previous_year, (int, float)):
-            growth_rates.append(0)
-        else:
-            growth_rate = ((current_year - previous_year) / previous_year) * 100
-            growth_rates.append(growth_rate)
+    growth_rates = (values - previous) / previous * 100
+    invalid = first_row | (previous == 0) | non_numeric | previous_non_numeric.astype(bool)
+    growth_rates = growth_rates.mask(invalid, invalid_value)
 
     df['Growth Rate (%)'] = growth_rates
     return df
 
 
+@profiled
 def index_rename_and_calculate_growth_rate(df, rename_dict=None, host_year=None, metric_column=None):
     """
     Second clean the data to prepare for growth rate comparison plot.
@@ -55,9 +87,9 @@ def index_rename_and_calculate_growth_rate(df, rename_dict=None, host_year=None,
     ... )
     >>> result[['Year', 'GDP_per_capita', 'Growth Rate (%)', 'Relative Year']]
        Year  GDP_per_capita  Growth Rate (%)  Relative Year
-    0  1999          1000.0         0.000000             -1
-    1  2000          1100.0        10.000000              0
-    2  2001          1210.0        10.000000              1
+    0  1999            1000              0.0             -1
+    1  2000            1100             10.0              0
+    2  2001            1210             10.0              1
     """
     # Handle empty DataFrame
     if df.empty:
@@ -106,7 +138,161 @@ def index_rename_and_calculate_growth_rate(df, rename_dict=None, host_year=None,
     return df
 
 
-def growth_rate_plot(dfs, countries, metric, colors=None):
+@profiled
+def growth_rate_view(df, rename_dict=None, host_year=None, metric_column=None):
+    """
+    Pure variant of index_rename_and_calculate_growth_rate: same result, but df is left untouched.
+
+    Every step returns a new frame instead of working in place; with pandas Copy-on-Write the unchanged
+    columns of the result share their arrays with df, so only 'Growth Rate (%)', 'Relative Year' and a
+    converted 'Year' are newly allocated.
+
+    :param df: a cleaned dataframe from DataProcess.py (not modified)
+    :param rename_dict: the columns needed to be renamed
+    :param host_year: the hosting year for alignment (e.g., 2000 or 2008)
+    :param metric_column: GDP or FDI column to apply the "calculate_growth_rate" function
+    :return: new DataFrame
+
+    >>> import pandas as pd
+    >>> test_df = pd.DataFrame({'Year': [2001, 2000, 1999], 'GDP': [1210, 1100, 1000]})
+    >>> result = growth_rate_view(test_df, rename_dict={'GDP': 'GDP_per_capita'}, host_year=2000,
+    ...                           metric_column='GDP_per_capita')
+    >>> result[['Year', 'GDP_per_capita', 'Growth Rate (%)', 'Relative Year']]
+       Year  GDP_per_capita  Growth Rate (%)  Relative Year
+    2  1999            1000              0.0             -1
+    1  2000            1100             10.0              0
+    0  2001            1210             10.0              1
+    >>> list(test_df.columns)
+    ['Year', 'GDP']
+    """
+    if df.empty:
+        print(f"Warning: Input DataFrame is empty for host year {host_year}.")
+        return pd.DataFrame({
+            'Country': [rename_dict.get('Country', 'Unknown')],
+            'Year': [host_year],
+            metric_column: [0],
+            'Relative Year': [0],
+            'Growth Rate (%)': [0]
+        })
+
+    result = df.reset_index(drop=True)  # Ensure continuous index
+    result.columns = result.columns.str.strip()
+
+    if rename_dict:
+        result = result.rename(columns=rename_dict)
+
+    if 'Year' not in result.columns:
+        raise ValueError("The DataFrame does not have a 'Year' column. Please check the data.")
+
+    years = pd.to_numeric(result['Year'], errors='coerce')  # Convert to numeric, invalid rows become NaN
+    if years.isna().any():
+        result, years = result[years.notna()], years[years.notna()]  # Drop rows with invalid Year
+    result = result.assign(Year=years.astype(int))  # Ensure Year is integer
+
+    if len(result) < 2:
+        raise ValueError("The DataFrame has insufficient rows for processing.")
+
+    if result['Year'].iloc[0] > result['Year'].iloc[-1]:  # High to Low
+        result = result.sort_values(by='Year')  # Sort ascending
+
+    # Check if host_year is within the Year range
+    if host_year not in result['Year'].values:
+        print(f"Warning: Host year {host_year} not found in the Year column for this dataset.")
+        return pd.DataFrame({
+            'Country': [rename_dict.get('Country', 'Unknown')],
+            'Year': [host_year],
+            metric_column: [0],
+            'Relative Year': [0],
+            'Growth Rate (%)': [0]
+        })
+
+    result = calculate_growth_rate(result, metric_column=metric_column)  # result is already a new frame
+    result['Relative Year'] = result['Year'] - host_year
+    return result
+
+
+growth_cache_size = 256  # growth series kept by cached_growth_rate_view
+_growth_cache = OrderedDict()
+_growth_cache_stats = {"hits": 0, "misses": 0}
+_growth_cache_lock = threading.Lock()
+
+
+def _copy_on_write():
+    """True when pandas shares data between a shallow copy and its source only until one is written."""
+    if int(pd.__version__.split(".")[0]) >= 3:
+        return True  # always on from pandas 3 (the option is deprecated there)
+    return pd.get_option("mode.copy_on_write") is True
+
+
+def _cache_copy(frame):
+    """Copy handed out by the growth cache: shallow under Copy-on-Write, deep otherwise (pandas < 3)."""
+    return frame.copy(deep=not _copy_on_write())
+
+
+def _frame_key(df):
+    """Content hash of a frame: values, index, column names and dtypes."""
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    digest.update(repr([(str(column), str(dtype)) for column, dtype in df.dtypes.items()]).encode())
+    return digest.hexdigest()
+
+
+@profiled
+def cached_growth_rate_view(df, rename_dict=None, host_year=None, metric_column=None):
+    """
+    Memoized growth_rate_view, keyed on the content of df and the other arguments (LRU, growth_cache_size).
+
+    A hit returns a copy of the stored frame, so editing it never changes the cached result:
+    a shallow one under Copy-on-Write (pandas >= 3, or the option on), a deep one otherwise.
+
+    :param df: a cleaned dataframe from DataProcess.py (not modified)
+    :param rename_dict: the columns needed to be renamed
+    :param host_year: the hosting year for alignment (e.g., 2000 or 2008)
+    :param metric_column: GDP or FDI column to apply the "calculate_growth_rate" function
+    :return: new DataFrame
+
+    >>> import pandas as pd
+    >>> clear_growth_cache()
+    >>> test_df = pd.DataFrame({'Year': [1999, 2000, 2001], 'GDP': [1000, 1100, 1210]})
+    >>> first = cached_growth_rate_view(test_df, host_year=2000, metric_column='GDP')
+    >>> second = cached_growth_rate_view(test_df.copy(), host_year=2000, metric_column='GDP')
+    >>> second.equals(first), growth_cache_info()
+    (True, {'hits': 1, 'misses': 1, 'size': 1})
+    >>> second.loc[0, 'GDP'] = -1.0
+    >>> float(cached_growth_rate_view(test_df, host_year=2000, metric_column='GDP').loc[0, 'GDP'])
+    1000.0
+    """
+    key = (_frame_key(df), repr(sorted((rename_dict or {}).items())), host_year, metric_column)
+    with _growth_cache_lock:
+        if key in _growth_cache:
+            _growth_cache.move_to_end(key)
+            _growth_cache_stats["hits"] += 1
+            return _cache_copy(_growth_cache[key])
+        _growth_cache_stats["misses"] += 1
+
+    result = growth_rate_view(df, rename_dict, host_year, metric_column)
+    with _growth_cache_lock:
+        _growth_cache[key] = result
+        while len(_growth_cache) > growth_cache_size:
+            _growth_cache.popitem(last=False)
+    return _cache_copy(result)
+
+
+def growth_cache_info():
+    """Hits, misses and current size of the cached_growth_rate_view cache."""
+    with _growth_cache_lock:
+        return {**_growth_cache_stats, "size": len(_growth_cache)}
+
+
+def clear_growth_cache():
+    """Empty the cached_growth_rate_view cache and reset its statistics."""
+    with _growth_cache_lock:
+        _growth_cache.clear()
+        _growth_cache_stats.update(hits=0, misses=0)
+
+
+@profiled
+def growth_rate_plot(dfs, countries, metric, colors=None, save_path=None):
     """
     Plot the growth rate for up to eight countries.
 
@@ -114,6 +300,7 @@ def growth_rate_plot(dfs, countries, metric, colors=None):
     :param countries: List of countries to compare growth rates.
     :param metric: Column to compare growth rates.
     :param colors: List of colors for each country's line (optional).
+    :param save_path: Write the figure to this file (png/svg/pdf) instead of showing it (optional).
     >>> import pandas as pd
     >>> test_data1 = {'Relative Year': [-1, 0, 1], 'Growth Rate (%)': [5.0, 10.0, 8.0]}
     >>> test_data2 = {'Relative Year': [-1, 0, 1], 'Growth Rate (%)': [3.0, 6.0, 7.0]}
@@ -126,6 +313,8 @@ def growth_rate_plot(dfs, countries, metric, colors=None):
     ...     colors=['blue', 'orange']
     ... )
     """
+    import matplotlib.pyplot as plt
+
     if colors is None:
         # Generate a default color palette
         colors = ['blue', 'yellow', 'green', 'purple', 'orange', 'pink', 'cyan', 'brown']
@@ -147,13 +336,11 @@ def growth_rate_plot(dfs, countries, metric, colors=None):
     plt.ylabel(f"{metric} Growth Rate (%)")
     plt.legend()
     plt.grid()
-    plt.show()
-
+    return _show_or_save(save_path)
 
-import matplotlib.pyplot as plt
 
-
-def eight_subplots(dataframes, host_years, legends, titles, x_column, y_column, xlabel, ylabel):
+@profiled
+def eight_subplots(dataframes, host_years, legends, titles, x_column, y_column, xlabel, ylabel, save_path=None):
     """
     Plot 8 subplots for given dataframes and metrics.
 
@@ -165,6 +352,7 @@ def eight_subplots(dataframes, host_years, legends, titles, x_column, y_column,
     :param y_column: Column name for the y-axis.
     :param xlabel: Label for the x-axis.
     :param ylabel: Label for the y-axis.
+    :param save_path: Write the figure to this file (png/svg/pdf) instead of showing it (optional).
     >>> import pandas as pd
     >>> test_data = {'Year': [1995, 1996, 1997, 1998, 1999], 'Value': [10, 12, 15, 14, 18]}
     >>> df1 = pd.DataFrame(test_data)
@@ -184,7 +372,7 @@ def eight_subplots(dataframes, host_years, legends, titles, x_column, y_column,
     ...     ylabel="Test Value"
     ... )
     """
-
+    import matplotlib.pyplot as plt
 
     plt.figure(figsize=(16, 12))  # Adjust figure size
 
@@ -195,7 +383,7 @@ def eight_subplots(dataframes, host_years, legends, titles, x_column, y_column,
         legend = legends[i]
         title = titles[i]
 
-        if df.empty:
+        if df is None or df.empty:
             plt.text(0.5, 0.5, "No Data Available", fontsize=12, ha='center', va='center')
             plt.title(title)
             plt.axis('off')
@@ -216,11 +404,12 @@ def eight_subplots(dataframes, host_years, legends, titles, x_column, y_column,
     # Adjust layout and show
     plt.tight_layout()
     plt.subplots_adjust(hspace=0.5, wspace=0.3)
-    plt.show()
+    return _show_or_save(save_path)
 
 
+@profiled
 def four_plot_health(
-        dfs, host_years, titles, x_column, y_column, xlabel, ylabel, metric, gender_column):
+        dfs, host_years, titles, x_column, y_column, xlabel, ylabel, metric, gender_column, save_path=None):
     """
     Compare health trends for four countries using three gender categories.
 
@@ -233,7 +422,10 @@ def four_plot_health(
     :param ylabel: Label for the y-axis.
     :param metric: Column to compare health trends.
     :param gender_column: Column name for the gender categories.
+    :param save_path: Write the figure to this file (png/svg/pdf) instead of showing it (optional).
     """
+    import matplotlib.pyplot as plt
+
     genders = ['Female', 'Male', 'Both sexes']
     colors = ['blue', 'orange', 'green']
 
@@ -258,38 +450,234 @@ def four_plot_health(
         plt.grid()
 
     plt.tight_layout()
-    plt.show()
+    return _show_or_save(save_path)
 
 
-def load_and_merge_data(cleaned_data_dict):
+def _show_or_save(save_path=None):
     """
-    Load and merge cleaned data dynamically based on the provided dictionary.
+    Show the current pyplot figure, or write it to save_path (format taken from the extension) and close it.
 
-    :param cleaned_data_dict: Dictionary with metric names as keys and a nested dictionary
-                              containing "AUS" and "CHI" DataFrames.
-    :return: Merged DataFrame with country-specific columns.
+    :return: save_path once written, None when the figure was shown
     """
-    merged_data = pd.DataFrame()
+    import matplotlib.pyplot as plt
+
+    if save_path is None:
+        with stage('matplotlib.show'):
+            plt.show()
+        return None
+    directory = os.path.dirname(save_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with stage('matplotlib.savefig'):
+        plt.savefig(save_path)
+    plt.close()
+    return save_path
+
+
+def _use_headless_backend():
+    """Switch matplotlib to the non-GUI Agg backend (process pool initializer)."""
+    import matplotlib.pyplot as plt
+
+    plt.switch_backend("Agg")
+
 
+def _render_figure(job):
+    plot_function, kwargs, save_path = job
+    return plot_function(**kwargs, save_path=save_path)
+
+
+@profiled
+def export_figures(jobs, max_workers=None):
+    """
+    Render many figures off-screen, fanned out over a process pool.
+
+    Each job is (plot_function, kwargs, save_path), where plot_function is one of the plotting functions
+    of this module accepting save_path (growth_rate_plot, eight_subplots, four_plot_health,
+    plot_correlation_heatmap, plot_predefined_combinations_bar). The file extension of save_path selects
+    the format (png, svg or pdf). Workers use the Agg backend, so no display is needed.
+
+    :param jobs: List of (plot_function, kwargs, save_path) tuples.
+    :param max_workers: Number of processes (default: all cores; 1 renders in this process).
+    :return: List of written files, in job order; jobs that drew nothing (e.g. an empty heatmap) are left out.
+
+    >>> import os, tempfile
+    >>> import pandas as pd
+    >>> df = pd.DataFrame({'Relative Year': [-1, 0, 1], 'Growth Rate (%)': [5.0, 10.0, 8.0]})
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     paths = export_figures([(growth_rate_plot, {'dfs': [df], 'countries': ['A'], 'metric': 'GDP'},
+    ...                              os.path.join(tmp, 'gdp.svg'))], max_workers=1)
+    ...     empty = (plot_correlation_heatmap, {'correlation_matrix': pd.DataFrame()}, os.path.join(tmp, 'none.svg'))
+    ...     paths += export_figures([empty], max_workers=1)
+    ...     [os.path.basename(path) for path in paths]
+    No data available to plot heatmap: Correlation Heatmap
+    ['gdp.svg']
+    """
+    import matplotlib.pyplot as plt
+
+    jobs = list(jobs)
+    if max_workers == 1 or len(jobs) <= 1:
+        backend = plt.get_backend()
+        _use_headless_backend()
+        try:
+            written = [_render_figure(job) for job in jobs]
+        finally:
+            plt.switch_backend(backend)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_use_headless_backend) as executor:
+            written = list(executor.map(_render_figure, jobs))
+    return [path for path in written if path is not None]
+
+
+@profiled
+def build_panel(cleaned_data_dict, year_column="Relative Year"):
+    """
+    Stack cleaned data of every metric and country into one tidy panel.
+
+    The panel has a (Country, year_column, Indicator) MultiIndex with categorical country/indicator
+    levels and a single float 'Value' column, so new countries or metrics only add rows.
+
+    :param cleaned_data_dict: Dictionary with metric names as keys and a nested dictionary
+                              of country key (e.g. "AUS", "CHI") -> DataFrame with year_column and metric columns.
+    :param year_column: Column used as the time level of the panel.
+    :return: Panel DataFrame sorted by its index.
+
+    >>> import pandas as pd
+    >>> gdp_aus = pd.DataFrame({'Relative Year': [-1, 0, 1], 'GDP': [1.0, 2.0, 3.0]})
+    >>> gdp_chi = pd.DataFrame({'Relative Year': [0, 1], 'GDP': [5.0, 6.0]})
+    >>> panel = build_panel({'GDP': {'AUS': gdp_aus, 'CHI': gdp_chi}})
+    >>> panel  # doctest: +NORMALIZE_WHITESPACE
+                                 Value
+    Country Relative Year Indicator
+    AUS     -1            GDP          1.0
+             0            GDP          2.0
+             1            GDP          3.0
+    CHI      0            GDP          5.0
+             1            GDP          6.0
+    >>> build_panel({'GDP': {'AUS': pd.DataFrame({'Year': [2000, None], 'GDP': [1.0, 2.0]})}}, 'Year')['Value'].tolist()
+    Warning: 1 GDP rows of AUS have no Year, dropped.
+    [1.0]
+    """
+    countries, years, indicators, values = [], [], [], []
     for metric_name, country_data in cleaned_data_dict.items():
-        aus_data = country_data["AUS"]
-        chi_data = country_data["CHI"]
+        for country, df in country_data.items():
+            if df is None or df.empty or metric_name not in df.columns:
+                print(f"Warning: no {metric_name} data for {country}.")
+                continue
+            year = pd.to_numeric(df[year_column], errors='coerce')
+            if year.isna().any():  # e.g. dates extract_years could not parse
+                print(f"Warning: {int(year.isna().sum())} {metric_name} rows of {country} have no {year_column}, "
+                      f"dropped.")
+                df, year = df[year.notna()], year[year.notna()]
+            countries.append(np.full(len(df), country, dtype=object))
+            years.append(year.to_numpy(dtype='int64'))
+            indicators.append(np.full(len(df), metric_name, dtype=object))
+            values.append(pd.to_numeric(df[metric_name], errors='coerce').to_numpy(dtype='float64'))
+
+    country_order = list(dict.fromkeys(c for data in cleaned_data_dict.values() for c in data))
+    index = pd.MultiIndex.from_arrays(
+        [
+            pd.Categorical(np.concatenate(countries) if countries else [], categories=country_order),
+            np.concatenate(years) if years else np.array([], dtype='int64'),
+            pd.Categorical(np.concatenate(indicators) if indicators else [], categories=list(cleaned_data_dict)),
+        ],
+        names=["Country", year_column, "Indicator"],
+    )
+    panel = pd.DataFrame({"Value": np.concatenate(values) if values else np.array([])}, index=index)
+
+    if panel.index.has_duplicates:
+        print("Warning: duplicated (country, year, indicator) rows found, keeping the first one.")
+        panel = panel[~panel.index.duplicated(keep="first")]
+    return panel.sort_index()
+
+
+@profiled
+def pivot_panel(panel, countries=None, indicators=None, suffixes=None):
+    """
+    Wide view of a panel with one '{indicator}{suffix}' column per indicator and country.
+
+    :param panel: Panel from build_panel.
+    :param countries: Countries to keep (default: all, in panel order).
+    :param indicators: Indicators to keep (default: all, in panel order).
+    :param suffixes: Dictionary of country -> column suffix (default: '_{country}').
+    :return: DataFrame with the time column followed by the indicator/country columns.
+
+    >>> import pandas as pd
+    >>> gdp_aus = pd.DataFrame({'Relative Year': [-1, 0, 1], 'GDP': [1.0, 2.0, 3.0]})
+    >>> gdp_chi = pd.DataFrame({'Relative Year': [0, 1], 'GDP': [5.0, 6.0]})
+    >>> fdi_aus = pd.DataFrame({'Relative Year': [-1, 0, 1], 'FDI': [0.1, 0.2, 0.3]})
+    >>> panel = build_panel({'GDP': {'AUS': gdp_aus, 'CHI': gdp_chi}, 'FDI': {'AUS': fdi_aus}})
+    >>> pivot_panel(panel)
+       Relative Year  GDP_AUS  GDP_CHI  FDI_AUS
+    0             -1      1.0      NaN      0.1
+    1              0      2.0      5.0      0.2
+    2              1      3.0      6.0      0.3
+    """
+    year_column = panel.index.names[1]
+    countries = list(panel.index.levels[0]) if countries is None else list(countries)
+    indicators = list(panel.index.levels[2]) if indicators is None else list(indicators)
+    suffixes = suffixes or {}
+
+    wide = panel["Value"].unstack(["Indicator", "Country"])
+    present = set(wide.columns)
+    columns = [(indicator, country) for indicator in indicators for country in countries
+               if (indicator, country) in present]
+    wide = wide.reindex(columns=pd.MultiIndex.from_tuples(columns, names=["Indicator", "Country"]))
+    wide.columns = [f"{indicator}{suffixes.get(country, f'_{country}')}" for indicator, country in columns]
+    wide.index = wide.index.astype('int64')
+    return wide.rename_axis(year_column).reset_index()
+
+
+@profiled
+def panel_country_view(panel, country, indicators=None):
+    """
+    Year x indicator view of one country, e.g. for its correlation matrix or line plots.
+
+    :param panel: Panel from build_panel.
+    :param country: Country key in the panel.
+    :param indicators: Indicators to keep (default: all).
+    :return: DataFrame indexed by the time column with one column per indicator.
+
+    >>> import pandas as pd
+    >>> gdp_aus = pd.DataFrame({'Relative Year': [-1, 0, 1], 'GDP': [1.0, 2.0, 3.0]})
+    >>> fdi_aus = pd.DataFrame({'Relative Year': [-1, 0, 1], 'FDI': [0.1, 0.2, 0.3]})
+    >>> panel_country_view(build_panel({'GDP': {'AUS': gdp_aus}, 'FDI': {'AUS': fdi_aus}}), 'AUS')  # doctest: +NORMALIZE_WHITESPACE
+    Indicator      GDP  FDI
+    Relative Year
+    -1             1.0  0.1
+     0             2.0  0.2
+     1             3.0  0.3
+    """
+    view = panel.xs(country, level="Country")["Value"].unstack("Indicator")
+    view.columns = view.columns.astype(object)
+    if indicators is not None:
+        view = view.reindex(columns=list(indicators))
+    return view
 
-        # Select relevant columns and rename for each country
-        aus_data = aus_data[["Relative Year", metric_name]].rename(columns={metric_name: f"{metric_name}_AUS"})
-        chi_data = chi_data[["Relative Year", metric_name]].rename(columns={metric_name: f"{metric_name}_CHI"})
 
-        if merged_data.empty:
-            # Initialize merged_data with the first metric
-            merged_data = aus_data.merge(chi_data, on="Relative Year", how="left")
-        else:
-            # Merge subsequent metrics
-            merged_data = merged_data.merge(aus_data, on="Relative Year", how="left")
-            merged_data = merged_data.merge(chi_data, on="Relative Year", how="left")
+@profiled
+def load_and_merge_data(cleaned_data_dict):
+    """
+    Load and merge cleaned data dynamically based on the provided dictionary.
 
-    return merged_data
+    Builds the long panel once and pivots it, instead of merging column by column,
+    so any number of countries can be passed (the column suffix is '_{country key}').
 
+    :param cleaned_data_dict: Dictionary with metric names as keys and a nested dictionary
+                              containing one DataFrame per country key (e.g. "AUS", "CHI").
+    :return: Merged DataFrame with country-specific columns.
 
+    >>> import pandas as pd
+    >>> gdp_aus = pd.DataFrame({'Relative Year': [0, 1], 'GDP': [1.0, 2.0]})
+    >>> gdp_chi = pd.DataFrame({'Relative Year': [0, 1], 'GDP': [5.0, 6.0]})
+    >>> load_and_merge_data({'GDP': {'AUS': gdp_aus, 'CHI': gdp_chi}})
+       Relative Year  GDP_AUS  GDP_CHI
+    0              0      1.0      5.0
+    1              1      2.0      6.0
+    """
+    return pivot_panel(build_panel(cleaned_data_dict))
+
+
+@profiled
 def calculate_correlation(df, metrics, time_period=None):
     """
     Calculate correlation between metrics within a specific time period.
@@ -304,6 +692,108 @@ def calculate_correlation(df, metrics, time_period=None):
     return df[metrics].corr()
 
 
+@profiled
+def calculate_rolling_correlation(df, metrics, window=5, mode="rolling", year_column="Relative Year"):
+    """
+    Correlation trajectories of every metric pair across sub-windows of Relative Year.
+
+    Cumulative sums of x, y, x*x, y*y and x*y are built once, so each window costs
+    a subtraction instead of a new .corr() over its rows.
+
+    :param df: DataFrame containing metrics and year_column (one row per year)
+    :param metrics: List of column names for metrics to analyze
+    :param window: Number of years per window for mode 'rolling'
+    :param mode: 'rolling'   - windows of `window` consecutive years sliding over the data
+                 'expanding' - windows growing from the first year: (first, first + 1), (first, first + 2), ...
+                 'centered'  - windows growing around the host year: (-1, 1), (-2, 2), ...
+    :param year_column: Column with the (relative) year
+    :return: DataFrame with Start, End, Metric 1, Metric 2, N (paired observations) and Correlation
+
+    >>> import pandas as pd
+    >>> data = {'Relative Year': [-2, -1, 0, 1, 2],
+    ...         'GDP': [1.0, 2.0, 3.0, 4.0, 5.0], 'FDI': [1.0, 3.0, 2.0, 5.0, 4.0]}
+    >>> calculate_rolling_correlation(pd.DataFrame(data), ['GDP', 'FDI'], window=3).round(3)
+       Start  End Metric 1 Metric 2  N  Correlation
+    0     -2    0      GDP      FDI  3        0.500
+    1     -1    1      GDP      FDI  3        0.655
+    2      0    2      GDP      FDI  3        0.655
+    >>> calculate_rolling_correlation(pd.DataFrame(data), ['GDP', 'FDI'], mode='centered').round(3)
+       Start  End Metric 1 Metric 2  N  Correlation
+    0     -1    1      GDP      FDI  3        0.655
+    1     -2    2      GDP      FDI  5        0.800
+    >>> scaled = pd.DataFrame({'Relative Year': [-1, 0, 1, 2], 'Ratio': [1e-4, 2e-4, 3e-4, 4e-4],
+    ...                        'GDP': [1e9, 2.2e9, 2.9e9, 4.1e9]})
+    >>> calculate_rolling_correlation(scaled, ['Ratio', 'GDP'], window=4)['Correlation'].round(3).tolist()
+    [0.995]
+    >>> calculate_rolling_correlation(pd.DataFrame(columns=['Relative Year', 'GDP', 'FDI']), ['GDP', 'FDI'])
+    Warning: no Relative Year values, no correlation windows.
+    Empty DataFrame
+    Columns: [Start, End, Metric 1, Metric 2, N, Correlation]
+    Index: []
+    """
+    columns = ["Start", "End", "Metric 1", "Metric 2", "N", "Correlation"]
+    df = df.sort_values(year_column)
+    years = pd.to_numeric(df[year_column], errors='coerce').to_numpy(dtype='float64')
+    if np.isnan(years).all():
+        print(f"Warning: no {year_column} values, no correlation windows.")
+        return pd.DataFrame(columns=columns)
+    values = df[metrics].apply(pd.to_numeric, errors='coerce').to_numpy(dtype='float64')
+
+    first, last = int(np.nanmin(years)), int(np.nanmax(years))
+    if mode == "rolling":
+        starts = np.arange(first, last - window + 2)
+        ends = starts + window - 1
+    elif mode == "expanding":
+        ends = np.arange(first + 1, last + 1)
+        starts = np.full(len(ends), first)
+    elif mode == "centered":
+        ends = np.arange(1, max(-first, last) + 1)
+        starts = -ends
+    else:
+        raise ValueError("mode must be one of 'rolling', 'expanding' or 'centered'.")
+
+    pairs = [(i, j) for i in range(len(metrics)) for j in range(i + 1, len(metrics))]
+    left = np.array([i for i, _ in pairs], dtype=int)
+    right = np.array([j for _, j in pairs], dtype=int)
+
+    # centre on the column means: correlation is shift invariant and the running sums stay well conditioned
+    values = values - np.nanmean(values, axis=0)
+    x, y = values[:, left], values[:, right]
+    paired = ~np.isnan(x) & ~np.isnan(y)
+    x, y = np.where(paired, x, 0.0), np.where(paired, y, 0.0)
+
+    def prefix(a):
+        return np.vstack([np.zeros((1, a.shape[1])), np.cumsum(a, axis=0)])
+
+    sums = {name: prefix(a) for name, a in
+            {"n": paired.astype('float64'), "x": x, "y": y, "xx": x * x, "yy": y * y, "xy": x * y}.items()}
+
+    # rows [lo, hi) of each window in the sorted data
+    lo = np.searchsorted(years, starts, side='left')
+    hi = np.searchsorted(years, ends, side='right')
+    window_sums = {name: total[hi] - total[lo] for name, total in sums.items()}  # (windows, pairs)
+
+    n = window_sums["n"]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = window_sums["xy"] - window_sums["x"] * window_sums["y"] / n
+        var_x = window_sums["xx"] - window_sums["x"] ** 2 / n
+        var_y = window_sums["yy"] - window_sums["y"] ** 2 / n
+        corr = cov / np.sqrt(var_x * var_y)
+    # each variance against its own metric's scale: a ratio in % next to GDP in dollars is still a valid pair
+    invalid = (n < 2) | (var_x <= 1e-12 * window_sums["xx"]) | (var_y <= 1e-12 * window_sums["yy"])
+    corr = np.where(invalid, np.nan, np.clip(corr, -1, 1))
+
+    n_windows, n_pairs = corr.shape
+    return pd.DataFrame({
+        "Start": np.repeat(starts, n_pairs),
+        "End": np.repeat(ends, n_pairs),
+        "Metric 1": np.tile([metrics[i] for i in left], n_windows),
+        "Metric 2": np.tile([metrics[j] for j in right], n_windows),
+        "N": n.astype(int).ravel(),
+        "Correlation": corr.ravel(),
+    })
+
+
 metric_groups = {
     "Economic": ["GDP_per_capita", "FDI", "Gov_Consumption"],
     "Social": ["Num_Arrivals", "Obesity_rate", "Underweight_rate", "Unemployment_Rate(%)"],
@@ -313,67 +803,270 @@ metric_groups = {
 country_suffix = {"Australia": "_AUS", "China": "_CHI"}
 
 
-def compute_country_correlation_matrices(merged_data, metric_groups, country_suffix):
+correlation_windows = {"short-term": (-2, 2), "mid-term": (-5, 5)}
+
+
+@profiled
+def batched_correlation(values):
+    """
+    Pearson correlation matrices for a whole stack of observation tables in one NumPy pass.
+
+    Like DataFrame.corr(), every pair of metrics uses the rows where both are present (NaN = missing).
+
+    :param values: Array of shape (..., n_observations, n_metrics)
+    :return: Array of shape (..., n_metrics, n_metrics)
+
+    >>> import numpy as np
+    >>> data = np.array([[1.0, 2.0, 1.0], [2.0, 4.0, np.nan], [3.0, 6.5, 0.0], [4.0, 8.0, -1.0]])
+    >>> np.round(batched_correlation(data), 3)
+    array([[ 1.   ,  0.996, -0.982],
+           [ 0.996,  1.   , -0.961],
+           [-0.982, -0.961,  1.   ]])
+    >>> tiny_and_huge = np.array([[1e-4, 1e9], [2e-4, 2.2e9], [3e-4, 2.9e9], [4e-4, 4.1e9]])
+    >>> round(float(batched_correlation(tiny_and_huge)[0, 1]), 3)
+    0.995
+    """
+    values = np.asarray(values, dtype="float64")
+    present = ~np.isnan(values)
+    counts_per_metric = present.sum(axis=-2, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # centre each metric first, correlation is shift invariant and this keeps the sums well conditioned
+        means = np.where(present, values, 0.0).sum(axis=-2, keepdims=True) / counts_per_metric
+        x = np.where(present, values - means, 0.0)
+        m = present.astype("float64")
+
+        n = np.einsum("...ti,...tj->...ij", m, m)
+        sum_x = np.einsum("...ti,...tj->...ij", x, m)  # sum of metric i over rows where j is present
+        sum_y = np.swapaxes(sum_x, -1, -2)
+        sum_xx = np.einsum("...ti,...tj->...ij", x * x, m)
+        sum_yy = np.swapaxes(sum_xx, -1, -2)
+        sum_xy = np.einsum("...ti,...tj->...ij", x, x)
+
+        cov = sum_xy - sum_x * sum_y / n
+        var_x = sum_xx - sum_x ** 2 / n
+        var_y = sum_yy - sum_y ** 2 / n
+        corr = cov / np.sqrt(var_x * var_y)
+
+    # each variance is compared to its own metric's scale, so metrics of very different magnitudes still pair
+    invalid = (n < 2) | (var_x <= 1e-12 * sum_xx) | (var_y <= 1e-12 * sum_yy)
+    corr = np.where(invalid, np.nan, np.clip(corr, -1.0, 1.0))
+
+    diagonal = np.diagonal(corr, axis1=-2, axis2=-1)
+    eye = np.eye(values.shape[-1], dtype=bool)
+    return np.where(eye & ~np.isnan(diagonal)[..., None, :], 1.0, corr)
+
+
+class CorrelationResults:
+    """
+    Correlation matrices of every (time window, country) computed by compute_correlation_engine.
+
+    values[w, c] is the full metric x metric matrix of windows[w] and countries[c];
+    group matrices are cut out of it on request, so nothing is printed or copied up front.
+    """
+
+    def __init__(self, values, windows, countries, metrics, metric_groups, country_suffix, available):
+        self.values = values
+        self.windows = windows
+        self.countries = countries
+        self.metrics = metrics
+        self.metric_groups = metric_groups
+        self.country_suffix = country_suffix
+        self.available = available
+
+    def matrix(self, country, group, window="mid-term"):
+        """
+        Correlation matrix of one metric group for one country and window.
+
+        :return: DataFrame labelled like compute_country_correlation_matrices ('{metric}{suffix}'),
+                 or None when fewer than two metrics of the group are available.
+        """
+        w = list(self.windows).index(window)
+        c = self.countries.index(country)
+        positions = [self.metrics.index(metric) for metric in self.metric_groups[group]
+                     if self.available[c, self.metrics.index(metric)]]
+        if len(positions) < 2:
+            return None
+        labels = [f"{self.metrics[p]}{self.country_suffix[country]}" for p in positions]
+        return pd.DataFrame(self.values[w, c][np.ix_(positions, positions)], index=labels, columns=labels)
+
+    def to_dict(self, window="mid-term"):
+        """
+        Same shape as compute_country_correlation_matrices: {country: {group: DataFrame}}.
+        """
+        matrices = {country: {} for country in self.countries}
+        for country in self.countries:
+            for group in self.metric_groups:
+                group_corr = self.matrix(country, group, window)
+                if group_corr is not None:
+                    matrices[country][group] = group_corr
+        return matrices
+
+    def to_frame(self):
+        """
+        Long table with one row per window, country, group and metric pair (upper triangle).
+        """
+        rows = []
+        for window in self.windows:
+            for country in self.countries:
+                for group in self.metric_groups:
+                    group_corr = self.matrix(country, group, window)
+                    if group_corr is None:
+                        continue
+                    metrics = [metric for metric in self.metric_groups[group]
+                               if f"{metric}{self.country_suffix[country]}" in group_corr.columns]
+                    for i in range(len(metrics)):
+                        for j in range(i + 1, len(metrics)):
+                            rows.append({
+                                "Window": window,
+                                "Country": country,
+                                "Group": group,
+                                "Metric 1": metrics[i],
+                                "Metric 2": metrics[j],
+                                "Correlation": group_corr.iat[i, j],
+                            })
+        return pd.DataFrame(rows, columns=["Window", "Country", "Group", "Metric 1", "Metric 2", "Correlation"])
+
+
+@profiled
+def compute_correlation_engine(merged_data, metric_groups, country_suffix, time_periods=None):
+    """
+    Compute every group correlation matrix for every country and time window at once.
+
+    The merged data is stacked into a (country, year, metric) array, masked per window,
+    and all matrices come out of a single batched_correlation call.
+
+    :param merged_data: DataFrame with merged country metrics and a 'Relative Year' column.
+    :param metric_groups: Dictionary of metric groups and their metrics.
+    :param country_suffix: Dictionary mapping country names to their column suffixes.
+    :param time_periods: Dictionary of window name -> (start, end) Relative Year
+                         (default: correlation_windows, short-term +-2 and mid-term +-5).
+    :return: CorrelationResults
+
+    >>> import pandas as pd
+    >>> merged = pd.DataFrame({
+    ...     'Relative Year': [-2, -1, 0, 1, 2],
+    ...     'GDP_AUS': [1.0, 2.0, 3.0, 4.0, 5.0], 'FDI_AUS': [2.0, 4.0, 6.0, 8.0, 11.0],
+    ...     'GDP_CHI': [5.0, 4.0, 3.0, 2.0, 2.0], 'FDI_CHI': [1.0, 2.0, 3.0, 4.0, 5.0],
+    ... })
+    >>> results = compute_correlation_engine(
+    ...     merged, {'Economic': ['GDP', 'FDI']}, {'Australia': '_AUS', 'China': '_CHI'},
+    ...     time_periods={'short-term': (-1, 1), 'mid-term': (-2, 2)})
+    >>> results.matrix('China', 'Economic', 'mid-term').round(3)
+             GDP_CHI  FDI_CHI
+    GDP_CHI     1.00    -0.97
+    FDI_CHI    -0.97     1.00
+    >>> results.to_frame()[['Window', 'Country', 'Correlation']].round(3)
+           Window    Country  Correlation
+    0  short-term  Australia        1.000
+    1  short-term      China       -1.000
+    2    mid-term  Australia        0.996
+    3    mid-term      China       -0.970
+    """
+    time_periods = time_periods or correlation_windows
+    metrics = list(dict.fromkeys(metric for group in metric_groups.values() for metric in group))
+    countries = list(country_suffix)
+
+    stacked = np.full((len(countries), len(merged_data), len(metrics)), np.nan)
+    available = np.zeros((len(countries), len(metrics)), dtype=bool)
+    for c, country in enumerate(countries):
+        for k, metric in enumerate(metrics):
+            column = f"{metric}{country_suffix[country]}"
+            if column in merged_data.columns:
+                stacked[c, :, k] = pd.to_numeric(merged_data[column], errors="coerce").to_numpy(dtype="float64")
+                available[c, k] = True
+
+    years = merged_data["Relative Year"].to_numpy()
+    window_masks = np.array([(years >= start) & (years <= end) for start, end in time_periods.values()])
+    windowed = np.where(window_masks[:, None, :, None], stacked[None], np.nan)  # (window, country, year, metric)
+
+    return CorrelationResults(batched_correlation(windowed), dict(time_periods), countries, metrics,
+                              metric_groups, country_suffix, available)
+
+
+@profiled
+def compute_country_correlation_matrices(merged_data, metric_groups, country_suffix, time_period=(-5, 5),
+                                         verbose=True):
     """
     Compute correlation matrices for each country and each metric group.
 
     :param merged_data: DataFrame with merged country metrics.
     :param metric_groups: Dictionary of metric groups and their metrics.
     :param country_suffix: Dictionary mapping country names to their column suffixes.
+    :param time_period: Tuple (start, end) to filter by Relative Year.
+    :param verbose: Print every matrix (set False to only return them).
     :return: Dictionary containing correlation matrices for each country and group.
     """
-    correlation_matrices = {country: {} for country in country_suffix}
-
-    for country, suffix in country_suffix.items():
-        print(f"\nComputing correlation matrices for {country}:")
-        for group, metrics in metric_groups.items():
-            group_columns = [f"{metric}{suffix}" for metric in metrics if f"{metric}{suffix}" in merged_data.columns]
-            if len(group_columns) > 1:
-                group_corr = calculate_correlation(merged_data, group_columns, time_period=(-5, 5))
-                correlation_matrices[country][group] = group_corr
-                print(f"\n{group} Correlation Matrix for {country}:")
-                print(group_corr)
-            else:
-                print(f"Not enough data for {group} metrics in {country}.")
+    results = compute_correlation_engine(merged_data, metric_groups, country_suffix,
+                                         time_periods={"window": time_period})
+    correlation_matrices = results.to_dict("window")
+
+    if verbose:
+        for country in country_suffix:
+            print(f"\nComputing correlation matrices for {country}:")
+            for group in metric_groups:
+                if group in correlation_matrices[country]:
+                    print(f"\n{group} Correlation Matrix for {country}:")
+                    print(correlation_matrices[country][group])
+                else:
+                    print(f"Not enough data for {group} metrics in {country}.")
     return correlation_matrices
 
 
-def plot_correlation_heatmap(correlation_matrix, title="Correlation Heatmap"):
+@profiled
+def plot_correlation_heatmap(correlation_matrix, title="Correlation Heatmap", save_path=None):
     """
     Plot a heatmap for the given correlation matrix.
 
     :param correlation_matrix: Correlation matrix (Pandas DataFrame)
     :param title: Title for the heatmap
+    :param save_path: Write the figure to this file (png/svg/pdf) instead of showing it (optional)
+    :return: save_path once written; None when shown, or when the matrix is empty and nothing is drawn
     """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
 
-    if correlation_matrix is not None and not correlation_matrix.empty:
-        plt.figure(figsize=(8, 6))
-        sns.heatmap(correlation_matrix, annot=True, cmap="coolwarm", fmt=".2f", linewidths=0.5)
-        plt.title(title, fontsize=16)
-        plt.xticks(rotation=45, ha="right")
-        plt.yticks(rotation=0)
-        plt.tight_layout()
-        plt.show()
-    else:
+    if correlation_matrix is None or correlation_matrix.empty:
         print(f"No data available to plot heatmap: {title}")
+        return None
+    plt.figure(figsize=(8, 6))
+    sns.heatmap(correlation_matrix, annot=True, cmap="coolwarm", fmt=".2f", linewidths=0.5)
+    plt.title(title, fontsize=16)
+    plt.xticks(rotation=45, ha="right")
+    plt.yticks(rotation=0)
+    plt.tight_layout()
+    return _show_or_save(save_path)
 
 
-def plot_all_heatmaps(correlation_matrices, metric_groups):
+@profiled
+def plot_all_heatmaps(correlation_matrices, metric_groups, output_dir=None, file_format="png", max_workers=None):
     """
     Plot heatmaps for each country and metric group.
 
     :param correlation_matrices: Dictionary containing correlation matrices by country.
     :param metric_groups: Dictionary defining the metric groups (e.g., Economic, Social).
+    :param output_dir: If given, render every heatmap off-screen into this folder, in parallel.
+    :param file_format: Figure format used with output_dir: 'png', 'svg' or 'pdf'.
+    :param max_workers: Number of rendering processes used with output_dir (default: all cores).
+    :return: List of written files when output_dir is given.
     """
+    jobs = []
     for country, group_data in correlation_matrices.items():
         print(f"Generating heatmaps for {country}:")
         for group, group_corr in group_data.items():
             if group_corr is not None:  # Ensure there is a valid correlation matrix
                 title = f"{group} Metric Correlation ({country})"
-                plot_correlation_heatmap(group_corr, title=title)
+                if output_dir is None:
+                    plot_correlation_heatmap(group_corr, title=title)
+                else:
+                    save_path = os.path.join(output_dir, f"heatmap_{group}_{country}.{file_format}")
+                    jobs.append((plot_correlation_heatmap, {"correlation_matrix": group_corr, "title": title},
+                                 save_path))
             else:
                 print(f"Not enough data for {group} metrics in {country}.")
 
+    if output_dir is not None:
+        return export_figures(jobs, max_workers=max_workers)
+
 
 # Define predefined combinations with descriptions
 predefined_combinations = {
@@ -408,7 +1101,10 @@ predefined_combinations = {
 }
 
 
+@profiled
 def predefined_correlation_analysis(merged_data):
+    import matplotlib.pyplot as plt
+
     # Display the menu with descriptions first
     print("\nAvailable Metric Combinations:")
     for key, combination in predefined_combinations.items():
@@ -459,6 +1155,111 @@ def predefined_correlation_analysis(merged_data):
     plt.show()
 
 
+@profiled
+def available_country_suffixes(merged_data, combinations=None):
+    """
+    Find the country suffixes (e.g. 'AUS', 'CHI') present in merged_data for the predefined metrics.
+
+    :param merged_data: DataFrame with '{metric}_{suffix}' columns.
+    :param combinations: Dictionary of predefined combinations (default: predefined_combinations).
+    :return: List of suffixes without the leading underscore, in column order.
+
+    >>> import pandas as pd
+    >>> merged = pd.DataFrame(columns=['Relative Year', 'GDP_per_capita_AUS', 'FDI_AUS', 'FDI_KOR'])
+    >>> available_country_suffixes(merged)
+    ['AUS', 'KOR']
+    """
+    combinations = predefined_combinations if combinations is None else combinations
+    metrics = {metric for combination in combinations.values() for metric in combination["metrics"]}
+
+    suffixes = []
+    for column in merged_data.columns:
+        for metric in metrics:
+            suffix = column[len(metric) + 1:]
+            if column.startswith(f"{metric}_") and suffix and "_" not in suffix and suffix not in suffixes:
+                suffixes.append(suffix)
+    return suffixes
+
+
+def _save_scatter(x, y, title, xlabel, ylabel, path):
+    """Draw the predefined-combination scatter plot on a standalone Figure (no pyplot/GUI) and save it."""
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(6, 4))
+    ax = fig.subplots()
+    ax.scatter(x, y, alpha=0.6, edgecolor='k')
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.grid(True)
+    with stage('matplotlib.savefig'):
+        fig.savefig(path)
+
+
+@profiled
+def batch_predefined_correlation_analysis(merged_data, combinations=None, countries=None, output_dir=None,
+                                          file_format="png"):
+    """
+    Non-interactive predefined_correlation_analysis: every combination for every country in one call.
+
+    :param merged_data: DataFrame containing merged data with '{metric}_{suffix}' columns.
+    :param combinations: Dictionary of predefined combinations (default: predefined_combinations).
+    :param countries: List of country suffixes, e.g. ['AUS', 'CHI'] (default: all found in merged_data).
+    :param output_dir: If given, a scatter figure per combination and country is written there.
+    :param file_format: Figure format, e.g. 'png', 'svg' or 'pdf'.
+    :return: DataFrame with one row per combination and country.
+
+    >>> import pandas as pd
+    >>> merged = pd.DataFrame({'Relative Year': [-1, 0, 1],
+    ...                        'GDP_per_capita_AUS': [1.0, 2.0, 3.0], 'FDI_AUS': [2.0, 4.0, 7.0]})
+    >>> result = batch_predefined_correlation_analysis(merged, combinations={k: predefined_combinations[k]
+    ...                                                                      for k in ['1', '2']})
+    >>> result[['Key', 'Country', 'Metric 1', 'Metric 2', 'N', 'Correlation', 'Status']].round(3)
+      Key Country        Metric 1         Metric 2  N  Correlation   Status
+    0   1     AUS  GDP_per_capita              FDI  3        0.993       ok
+    1   2     AUS  GDP_per_capita  Gov_Consumption  0          NaN  missing
+    """
+    combinations = predefined_combinations if combinations is None else combinations
+    countries = available_country_suffixes(merged_data, combinations) if countries is None else countries
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    rows = []
+    for key, combination in combinations.items():
+        metric1, metric2 = combination["metrics"]
+        for country in countries:
+            metric1_col = f"{metric1}_{country}"
+            metric2_col = f"{metric2}_{country}"
+            row = {
+                "Key": key,
+                "Description": combination["description"],
+                "Country": country,
+                "Metric 1": metric1,
+                "Metric 2": metric2,
+                "N": 0,
+                "Correlation": np.nan,
+                "Status": "missing",
+                "Figure": None,
+            }
+
+            if metric1_col in merged_data.columns and metric2_col in merged_data.columns:
+                pair = merged_data[[metric1_col, metric2_col]].apply(pd.to_numeric, errors='coerce')
+                row["N"] = int(pair.notna().all(axis=1).sum())
+                row["Correlation"] = pair.corr().iloc[0, 1]
+                row["Status"] = "ok"
+
+                if output_dir is not None:
+                    path = os.path.join(output_dir, f"correlation_{key}_{metric1}_{metric2}_{country}.{file_format}")
+                    _save_scatter(pair[metric1_col], pair[metric2_col],
+                                  f"Correlation between {metric1} and {metric2} in {country}", metric1, metric2, path)
+                    row["Figure"] = path
+            rows.append(row)
+
+    return pd.DataFrame(rows, columns=["Key", "Description", "Country", "Metric 1", "Metric 2", "N",
+                                       "Correlation", "Status", "Figure"])
+
+
+@profiled
 def highlight_key_correlations_all_matrices(correlation_matrices, country):
     """
     Highlight the strongest and weakest correlations across all metric group matrices for a given country.
@@ -483,13 +1284,18 @@ def highlight_key_correlations_all_matrices(correlation_matrices, country):
         print(f"  Weakest correlation: {weakest_pair} = {weakest_value:.2f}")
 
 
-def plot_predefined_combinations_bar(predefined_combinations, merged_data):
+@profiled
+def plot_predefined_combinations_bar(predefined_combinations, merged_data, save_path=None):
     """
     Computes correlations for predefined combinations and plots a bar chart.
 
     :param predefined_combinations: Dictionary of metric pairs and descriptions.
     :param merged_data: DataFrame containing merged data with metrics for both countries.
+    :param save_path: Write the figure to this file (png/svg/pdf) instead of showing it (optional).
     """
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
     correlations = []
 
     for key, combo in predefined_combinations.items():
@@ -524,7 +1330,33 @@ def plot_predefined_combinations_bar(predefined_combinations, merged_data):
     plt.grid(axis="y", linestyle="--", alpha=0.7)
     plt.legend(title="Country")
     plt.tight_layout()
-    plt.show()
+    return _show_or_save(save_path)
 
 
+def main(argv=None):
+    """
+    Command line entry point: run batch_predefined_correlation_analysis on a merged data csv.
+
+    Example: python BetweenCountry.py merged_data.csv --output-dir figures --results correlations.csv
+    """
+    parser = argparse.ArgumentParser(description="Evaluate every predefined metric combination for every country.")
+    parser.add_argument("merged_data", help="csv produced from load_and_merge_data (with a 'Relative Year' column)")
+    parser.add_argument("--countries", nargs="+", help="country suffixes, e.g. AUS CHI (default: all found)")
+    parser.add_argument("--output-dir", help="write one scatter figure per combination and country here")
+    parser.add_argument("--format", default="png", help="figure format: png, svg or pdf")
+    parser.add_argument("--results", help="write the results table to this csv instead of printing it")
+    args = parser.parse_args(argv)
+
+    merged_data = pd.read_csv(args.merged_data)
+    results = batch_predefined_correlation_analysis(
+        merged_data, countries=args.countries, output_dir=args.output_dir, file_format=args.format)
+
+    if args.results:
+        results.to_csv(args.results, index=False)
+    else:
+        print(results.to_string(index=False))
+    return results
+
 
+if __name__ == '__main__':
+    main()
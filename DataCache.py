@@ -0,0 +1,248 @@
+import functools
+import hashlib
+import inspect
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# On-disk cache for the preprocess_csv_* loaders in DataProcess.py.
+# Each cached result is one .npz file: every column is stored as its own binary array,
+# so a warm run only loads arrays and skips read_csv / melt entirely.
+# Key = sha256(source file content + loader name + source of the loader's whole module + call parameters),
+# so editing the csv, the loader, any helper it calls in that module (read_wide_csv, extract_years, ...)
+# or the arguments automatically misses the old entry.
+
+CACHE_DIR = os.environ.get('OLYMPIC_CACHE_DIR', os.path.join('.cache', 'preprocess'))
+MAX_CACHE_BYTES = int(os.environ.get('OLYMPIC_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+CACHE_ENABLED = os.environ.get('OLYMPIC_CACHE', '1') != '0'
+CACHE_VERSION = 1  # bump when the on-disk layout changes
+
+_file_digests = {}  # (path, size, mtime) -> sha256, avoids re-hashing unchanged files in one session
+
+
+def file_digest(file_path):
+    """
+    Hash the content of a file, remembering the result while size and mtime stay the same.
+
+    :param file_path: path of the file
+    :return: hex sha256 of the file content
+
+    >>> import tempfile, os
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     path = os.path.join(tmp, 'a.csv')
+    ...     with open(path, 'w') as f:
+    ...         _ = f.write('Year,Value\\n2000,1\\n')
+    ...     file_digest(path)[:12]
+    '6eea98a0f9a1'
+    """
+    stat = os.stat(file_path)
+    memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_digests:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _file_digests[memo_key] = digest.hexdigest()
+    return _file_digests[memo_key]
+
+
+@functools.lru_cache(maxsize=None)
+def _source_digest(func):
+    """Hash of the source of the module defining func, so edits to the helpers it calls count too."""
+    module = inspect.getmodule(func)
+    source = inspect.getsource(module) if module is not None else inspect.getsource(func)
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def cache_key(func, file_path, params):
+    """
+    Build the cache key of one loader call.
+
+    :param func: loader function
+    :param file_path: csv file path
+    :param params: dict of the other call parameters
+    :return: hex string
+    """
+    payload = {
+        'version': CACHE_VERSION,
+        'func': func.__qualname__,
+        'source': _source_digest(func),
+        'file': file_digest(file_path),
+        'params': params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+def _pack_column(values):
+    """Split a column into plain numpy arrays (no pickled objects) plus its dtype description."""
+    dtype = values.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        categories, categories_meta = _pack_column(pd.Series(dtype.categories))
+        arrays = {'codes': values.cat.codes.to_numpy()}
+        arrays.update({f'categories_{name}': array for name, array in categories.items()})
+        return arrays, {'kind': 'category', 'ordered': bool(dtype.ordered), 'categories': categories_meta}
+    if dtype.kind in 'biufcmM' and not isinstance(dtype, pd.api.extensions.ExtensionDtype):
+        return {'data': values.to_numpy()}, {'kind': 'numeric', 'dtype': str(dtype)}
+
+    # strings / objects / extension dtypes: text + missing mask
+    missing = values.isna().to_numpy()
+    text = values.astype(object).where(~missing, '').astype(str).to_numpy(dtype=str)
+    return {'data': text, 'missing': missing}, {'kind': 'text', 'dtype': str(dtype)}
+
+
+def _unpack_column(arrays, meta, prefix=''):
+    if meta['kind'] == 'category':
+        categories = _unpack_column(arrays, meta['categories'], prefix + 'categories_')
+        return pd.Categorical.from_codes(arrays[prefix + 'codes'], categories=categories, ordered=meta['ordered'])
+    if meta['kind'] == 'numeric':
+        return arrays[prefix + 'data']
+    values = arrays[prefix + 'data'].astype(object)
+    values[arrays[prefix + 'missing']] = np.nan
+    if meta['dtype'] == 'object':
+        return values
+    return pd.Series(values, dtype=object).astype(meta['dtype']).to_numpy()
+
+
+def write_frame(df, path):
+    """
+    Store a DataFrame as one binary array per column (atomically replaces `path`).
+
+    :param df: pd.DataFrame
+    :param path: target .npz path
+    """
+    arrays = {}
+    layout = {'columns': [], 'index': None}
+    for position, column in enumerate(list(df.columns) + ['__index__']):
+        values = df.index.to_series() if column == '__index__' else df.iloc[:, position]
+        packed, meta = _pack_column(values)
+        arrays.update({f'c{position}_{name}': array for name, array in packed.items()})
+        if column == '__index__':
+            layout['index'] = {'name': df.index.name, 'meta': meta, 'position': position}
+        else:
+            layout['columns'].append({'name': column, 'meta': meta})
+    arrays['__layout__'] = np.array(json.dumps(layout, default=str))
+
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, path)
+
+
+def read_frame(path):
+    """
+    Load a DataFrame written by write_frame.
+
+    :param path: .npz path
+    :return: pd.DataFrame
+
+    >>> import tempfile, os
+    >>> import pandas as pd
+    >>> df = pd.DataFrame({'Country Name': ['Australia', 'China'], 'Year': [2000, 2000], 'GDP': [1.5, None]},
+    ...                   index=[3, 7])
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     path = os.path.join(tmp, 'frame.npz')
+    ...     write_frame(df, path)
+    ...     read_frame(path).equals(df)
+    True
+    """
+    with np.load(path, allow_pickle=False) as archive:
+        arrays = {name: archive[name] for name in archive.files}
+    layout = json.loads(str(arrays['__layout__']))
+
+    data = {}
+    for position, column in enumerate(layout['columns']):
+        data[position] = _unpack_column(arrays, column['meta'], f'c{position}_')
+    index_info = layout['index']
+    index = pd.Index(_unpack_column(arrays, index_info['meta'], f"c{index_info['position']}_"),
+                     name=index_info['name'])
+    df = pd.DataFrame(data, index=index)
+    df.columns = [column['name'] for column in layout['columns']]
+    return df
+
+
+def evict(cache_dir=None, max_bytes=None):
+    """
+    Remove least recently used entries until the cache fits in max_bytes.
+
+    :param cache_dir: cache directory (defaults to CACHE_DIR)
+    :param max_bytes: size limit in bytes (defaults to MAX_CACHE_BYTES)
+    :return: list of removed file names
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(cache_dir):
+        return []
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.npz'):
+            stat = os.stat(os.path.join(cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+    entries.sort()  # oldest use first
+
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, name in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:  # removed by another process
+            pass
+        total -= size
+        removed.append(name)
+    return removed
+
+
+def clear_cache(cache_dir=None):
+    """
+    Delete every cached frame.
+
+    :param cache_dir: cache directory (defaults to CACHE_DIR)
+    """
+    return evict(cache_dir, max_bytes=0)
+
+
+def cached_preprocess(func):
+    """
+    Decorator caching the DataFrame returned by a preprocess_csv_* loader.
+
+    Only calls whose file_path is a real file are cached; file-like objects (e.g. StringIO in doctests)
+    always run the loader. A hit refreshes the entry's mtime, which drives the LRU eviction.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        params = dict(bound.arguments)
+        file_path = params.pop('file_path')
+
+        if not CACHE_ENABLED or not isinstance(file_path, (str, os.PathLike)) or not os.path.isfile(file_path):
+            return func(*args, **kwargs)
+
+        path = os.path.join(CACHE_DIR, cache_key(func, file_path, params) + '.npz')
+        if os.path.exists(path):
+            try:
+                df = read_frame(path)
+                os.utime(path)
+                return df
+            except (OSError, ValueError, KeyError):
+                pass  # unreadable entry, rebuild it below
+
+        df = func(*args, **kwargs)
+        if isinstance(df, pd.DataFrame):
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            write_frame(df, path)
+            evict()
+        return df
+
+    wrapper.uncached = func
+    return wrapper
@@ -1,5 +1,13 @@
+import csv
+import io
+import re
+
+import numpy as np
 import pandas as pd
 
+from DataCache import cached_preprocess
+from Profiling import profiled, stage
+
 
 # 1. load data
 # 2. date format: Date(YYYY), Period（AUS/CHI OBE; AUS/CHI UNDER）, --> YEAR
@@ -9,8 +17,129 @@ import pandas as pd
 # 3. Keep Countries
 # 4. Year Range Select：i.e., AUS 1995-2005；CHI 2003-2013
 
+# Olympic hosts of the study, keyed by their World Bank 'Country Name'
+olympic_hosts = {
+    "Canada": 1976,
+    "Korea, Rep.": 1988,
+    "Spain": 1992,
+    "United States": 1996,
+    "Australia": 2000,
+    "Greece": 2004,
+    "China": 2008,
+    "United Kingdom": 2012,
+}
+window_years = 5  # years before and after the host year
+
+
+# explicit formats tried before pandas' per-value inference (which is several times slower)
+date_formats = ['%Y-%m-%d', '%m/%d/%Y', '%Y/%m/%d', '%Y']
+
+
+def _detect_date_format(value):
+    for date_format in date_formats:
+        if pd.notna(pd.to_datetime(value, format=date_format, errors='coerce')):
+            return date_format
+    return None
+
+
+# fixed-width layout of the zero-padded known formats: length, separator positions, year / month / day slices
+_date_layouts = {
+    '%Y-%m-%d': (10, {4: '-', 7: '-'}, slice(0, 4), slice(5, 7), slice(8, 10)),
+    '%m/%d/%Y': (10, {2: '/', 5: '/'}, slice(6, 10), slice(0, 2), slice(3, 5)),
+    '%Y/%m/%d': (10, {4: '/', 7: '/'}, slice(0, 4), slice(5, 7), slice(8, 10)),
+    '%Y': (4, {}, slice(0, 4), None, None),
+}
+
+
+def _sliced_years(codes, date_format):
+    """
+    Years of the strings that match a fixed-width layout exactly (valid month and day included), NaN elsewhere.
+
+    :param codes: (n, 11) int32 array of the unicode code points of the strings, 0-padded
+    :param date_format: key of _date_layouts
+    """
+    width, separators, year_slice, month_slice, day_slice = _date_layouts[date_format]
+    digits = codes[:, :width] - ord('0')
+    ok = codes[:, width] == 0  # no character after the layout
+    for position, separator in separators.items():
+        ok &= codes[:, position] == ord(separator)
+        digits[:, position] = 0
+    ok &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+
+    def number(columns):
+        total = digits[:, columns.start]
+        for column in range(columns.start + 1, columns.stop):
+            total = total * 10 + digits[:, column]
+        return total
+
+    year = number(year_slice)
+    ok &= year >= 1
+    if month_slice is not None:
+        month, day = number(month_slice), number(day_slice)
+        leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+        month_days = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[np.clip(month, 0, 12)]
+        ok &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days + (leap & (month == 2)))
+    return np.where(ok, year, np.nan)
+
+
+@profiled
+def extract_years(values):
+    """
+    Year of every date string, NaN for invalid dates.
+
+    Zero-padded dates in the known formats are read by slicing the year out of the string (month and
+    day are still validated); the format is detected once from the first date and tried first.
+    Only the rows no layout accepts go through pd.to_datetime with the explicit formats, and whatever
+    is left through pandas' per-value inference, so mixed 'YYYY-MM-DD' / 'MM/DD/YYYY' columns keep every year.
+    :param values: pd.Series of dates
+    :return: pd.Series of years: int64 when every date is valid, float64 with NaN otherwise
+
+    >>> import pandas as pd
+    >>> extract_years(pd.Series(['2020-01-01', '2021-02-29', '2020-02-29', '03/15/1999', '1988', '3/5/1999', None])
+    ...               ).tolist()
+    [2020.0, nan, 2020.0, 1999.0, 1988.0, 1999.0, nan]
+    >>> extract_years(pd.Series(['2001-01-01', '2002-06-30'])).dtype
+    dtype('int64')
+    """
+    years = np.full(len(values), np.nan)
+    pending = values.notna().to_numpy().copy()
+    if not pending.any():
+        return pd.Series(years, index=values.index)
+
+    text = values[pending].astype(str)
+    # code points of the first 11 characters: the 11th is 0 only for strings that fit a 10 character layout
+    codes = np.asarray(text.to_numpy(dtype=object), dtype='U11').view('int32').reshape(-1, 11)
+
+    first_format = _detect_date_format(text.iloc[0])
+    formats = [first_format] + [date_format for date_format in date_formats if date_format != first_format]
+    sliced = np.full(len(text), np.nan)
+    for date_format in formats:
+        if date_format is None:
+            continue
+        unmatched = np.isnan(sliced)
+        if not unmatched.any():
+            break
+        sliced[unmatched] = _sliced_years(codes if unmatched.all() else codes[unmatched], date_format)
+    years[pending] = sliced
+    pending[pending] = np.isnan(sliced)
+
+    for date_format in formats:  # non-padded dates ('3/5/1999'), strptime accepts them
+        if date_format is None or not pending.any():
+            continue
+        parsed = pd.to_datetime(values[pending], format=date_format, errors='coerce')
+        years[pending] = parsed.dt.year.to_numpy(dtype='float64')
+        pending[pending] = parsed.isna().to_numpy()
+
+    if pending.any():  # no known format: let pandas infer per value
+        parsed = pd.to_datetime(values[pending], format='mixed', errors='coerce')
+        years[pending] = parsed.dt.year.to_numpy(dtype='float64')
+    if not np.isnan(years).any():
+        return pd.Series(years.astype('int64'), index=values.index)
+    return pd.Series(years, index=values.index)
+
 
 # works for 2 GDP csv with date format YYYY/MM/DD (KOR, UK)
+@profiled
 def normalize_date(df, date_column):
     """
     Change different date format to YYYY
@@ -22,17 +151,18 @@ def normalize_date(df, date_column):
     >>> test_df = pd.DataFrame(data)
     >>> result = normalize_date(test_df, 'Date')
     >>> result
-          Date
-    0    2020
-    1    2021
-    2    2022
+         Date
+    0  2020.0
+    1  2021.0
+    2  2022.0
     3     NaN
     """
-    df[date_column] = pd.to_datetime(df[date_column], errors='coerce').dt.year # if invalid, use NaT
+    df[date_column] = extract_years(df[date_column])  # if invalid, use NaN
     return df
 
 
 # works for 6 world csv, to extract only selected countries
+@profiled
 def filter_by_country(df, country_column, countries):
     """
     Keep only required countries (Australia, China)
@@ -55,6 +185,7 @@ def filter_by_country(df, country_column, countries):
 
 # for most csv. Must implement after normalize date (so only YYYY left)
 # extract year range (10 year window)
+@profiled
 def filter_by_year_range(df, year_column, year_range):
     """
     Keep only required year range
@@ -78,6 +209,7 @@ def filter_by_year_range(df, year_column, year_range):
 
 
 # for GDP per capita (FDI is still in current US$ total)
+@profiled
 def convert_values(df, value_column, convert_to_billion=False, convert_to_million=False, column_label="Value"):
     """
     Convert values to billions or millions and rename column dynamically.
@@ -113,9 +245,78 @@ def convert_values(df, value_column, convert_to_billion=False, convert_to_millio
     return df
 
 
+# year-like columns stored as int16 by compact_frame when they hold whole numbers only
+year_like_columns = ('Year', 'Period', 'Date', 'Relative Year')
+
+
+@profiled
+def memory_footprint(df):
+    """
+    Deep memory usage of a DataFrame (or of every frame of a dict of frames) in bytes.
+    :param df: pd.DataFrame or dict of pd.DataFrame
+    :return: int
+    """
+    if isinstance(df, dict):
+        return sum(memory_footprint(frame) for frame in df.values())
+    return int(df.memory_usage(deep=True).sum())
+
+
+@profiled
+def compact_frame(df, rtol=1e-6, verbose=False):
+    """
+    Shrink a preprocessed frame: repeated text -> category, whole-number years / integers -> int16 (or int32),
+    floats -> float32 when every value survives the round trip within rtol.
+    :param df: pd.DataFrame
+    :param rtol: relative tolerance allowed for the float32 round trip
+    :param verbose: print the memory footprint before and after
+    :return: pd.DataFrame
+
+    >>> import pandas as pd
+    >>> df = pd.DataFrame({'Country Name': ['Australia'] * 3 + ['China'] * 3, 'Year': [2000.0, 2001.0, 2002.0] * 2,
+    ...                    'Value': [1.5, 2.25, None, 3.0, 4.0, 5.0], 'GDP': [1e-320, 1.0, 2.0, 3.0, 4.0, 5.0]})
+    >>> compact_frame(df).dtypes.astype(str).tolist()
+    ['category', 'int16', 'float32', 'float64']
+    """
+    before = memory_footprint(df) if verbose else 0
+    df = df.copy()
+    int16 = np.iinfo(np.int16)
+
+    for column in df.columns:
+        values = df[column]
+        dtype = values.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            continue
+        if dtype == object or pd.api.types.is_string_dtype(dtype):
+            if values.nunique(dropna=True) <= len(values) // 2:
+                df[column] = values.astype('category')
+        elif pd.api.types.is_integer_dtype(dtype) and not pd.api.types.is_extension_array_dtype(dtype):
+            if len(values) and int16.min <= values.min() and values.max() <= int16.max:
+                df[column] = values.astype(np.int16)
+            elif len(values) and np.iinfo(np.int32).min <= values.min() and values.max() <= np.iinfo(np.int32).max:
+                df[column] = values.astype(np.int32)
+        elif pd.api.types.is_float_dtype(dtype):
+            array = values.to_numpy(dtype='float64')
+            whole = np.isfinite(array).all() and (array == np.round(array)).all()
+            if column in year_like_columns and whole and len(array) and \
+                    int16.min <= array.min() and array.max() <= int16.max:
+                df[column] = array.astype(np.int16)
+                continue
+            with np.errstate(over='ignore'):
+                narrowed = array.astype(np.float32).astype(np.float64)
+            if np.allclose(narrowed, array, rtol=rtol, atol=0, equal_nan=True):
+                df[column] = array.astype(np.float32)
+
+    if verbose:
+        print(f"Memory: {before / 1024:.1f} KB -> {memory_footprint(df) / 1024:.1f} KB")
+    return df
+
+
+@profiled
+@cached_preprocess
 def preprocess_csv_type1(
     file_path, date_column, year_column, year_range,
-    value_column=None, skip_rows=None, convert_to_million=False, convert_to_billion=False, column_label=None):
+    value_column=None, skip_rows=None, convert_to_million=False, convert_to_billion=False, column_label=None,
+    compact=False, encoding=None):
     """
     To process csv type 1, which is for country with 'Date' column.
     :param file_path: csv file path
@@ -126,6 +327,8 @@ def preprocess_csv_type1(
     :param skip_rows: skip rows until column name occurs
     :param convert_to_million: whether to convert values to millions
     :param convert_to_billion: whether to convert values to billions
+    :param compact: return a compact_frame (categorical names, int16 years, float32 values)
+    :param encoding: file encoding (default: utf-8)
     :return: pd.DataFrame
 
     >>> import pandas as pd
@@ -151,7 +354,8 @@ def preprocess_csv_type1(
     1  2002  2.0
     2  2003  3.0
     """
-    df = pd.read_csv(file_path, skiprows=skip_rows)
+    with stage('pandas.read_csv'):
+        df = pd.read_csv(file_path, skiprows=skip_rows, encoding=encoding)
     df = normalize_date(df, date_column)
     df = filter_by_year_range(df, year_column, year_range)
 
@@ -165,10 +369,45 @@ def preprocess_csv_type1(
             column_label=column_label
         )
     df.columns = df.columns.str.strip()
-    return df
+    return compact_frame(df) if compact else df
+
+
+# WHO cells look like "30.5 [24.1-37.0]": point estimate, optional bracketed uncertainty interval
+_number_pattern = r'[-+]?(?:\d+\.?\d*|\.\d+)'
+bracketed_value_pattern = re.compile(rf'\s*(?P<value>{_number_pattern})?\s*'
+                                     rf'(?:\[\s*(?P<lower>{_number_pattern})\s*-\s*(?P<upper>{_number_pattern})\s*\])?')
+
+
+@profiled
+def parse_bracketed_values(values):
+    """
+    Split WHO style "estimate [lower-upper]" cells into three numeric columns.
 
+    Cells are factorized first, so each distinct string is parsed once and the numbers are
+    broadcast back with one take (WHO estimates have one decimal, hence few distinct cells).
+    :param values: pd.Series of cells
+    :return: pd.DataFrame with 'Value', 'Lower Bound', 'Upper Bound' (NaN where absent)
 
-def preprocess_csv_type2(file_path, country_column, countries, year_column, year_range, skip_rows=None):
+    >>> import pandas as pd
+    >>> parse_bracketed_values(pd.Series(['30.5 [24.1-37.0]', '29.7 [note]', 'No data', 1.5, '-0.4 [-1.2-0.3]', None]))
+       Value  Lower Bound  Upper Bound
+    0   30.5         24.1         37.0
+    1   29.7          NaN          NaN
+    2    NaN          NaN          NaN
+    3    1.5          NaN          NaN
+    4   -0.4         -1.2          0.3
+    5    NaN          NaN          NaN
+    """
+    codes, uniques = pd.factorize(values.astype(str))
+    match = bracketed_value_pattern.match
+    parsed = np.array([match(cell).groups() for cell in uniques] + [(None, None, None)], dtype='float64')
+    return pd.DataFrame(parsed[codes], index=values.index, columns=['Value', 'Lower Bound', 'Upper Bound'])
+
+
+@profiled
+@cached_preprocess
+def preprocess_csv_type2(file_path, country_column, countries, year_column, year_range, skip_rows=None,
+                         keep_bounds=True, compact=False, encoding=None):
     """
     To process csv type 2, which is for country with 'Period' column.
     :param file_path: csv file path
@@ -177,13 +416,16 @@ def preprocess_csv_type2(file_path, country_column, countries, year_column, year
     :param year_column: which column to normalize
     :param year_range: year range
     :param skip_rows: skip rows until column name occurs
+    :param keep_bounds: keep the bracketed uncertainty interval as 'Lower Bound' / 'Upper Bound' columns
+    :param compact: return a compact_frame (categorical names, int16 years, float32 values)
+    :param encoding: file encoding (default: utf-8)
     :return: pd.DataFrame
 
     >>> import pandas as pd
     >>> from io import StringIO
     >>> csv_data = '''
     ... Location,Period,Dim1,Value
-    ... Australia,2000,Female,30.5 [info]
+    ... Australia,2000,Female,30.5 [24.1-37.0]
     ... Australia,2001,Male,29.7 [note]
     ... China,2000,Female,25.1 [data]
     ... China,2001,Male,24.9 [info]
@@ -198,28 +440,104 @@ def preprocess_csv_type2(file_path, country_column, countries, year_column, year
     ...     skip_rows=None
     ... )
     >>> result
-        Location  Period    Dim1  Value
-    0  Australia    2000  Female   30.5
-    1  Australia    2001    Male   29.7
+        Location  Period    Dim1  Value  Lower Bound  Upper Bound
+    0  Australia    2000  Female   30.5         24.1         37.0
+    1  Australia    2001    Male   29.7          NaN          NaN
     """
-    df = pd.read_csv(file_path, skiprows=skip_rows)
+    with stage('pandas.read_csv'):
+        df = pd.read_csv(file_path, skiprows=skip_rows, encoding=encoding)
     df = filter_by_country(df, country_column, countries)
     df[year_column] = pd.to_numeric(df[year_column], errors='coerce')
     df = filter_by_year_range(df, year_column, year_range)
 
-    # Keep only Value, Location, Period cols
-    df = df[[country_column, year_column,'Dim1', 'Value']]
+    # Split the 'Value' column into the estimate and its bracketed bounds
+    parts = parse_bracketed_values(df['Value'])
+    if not keep_bounds:
+        parts = parts[['Value']]
 
-    # Clean the 'Value' column to remove text inside brackets
-    df['Value'] = df['Value'].apply(lambda x: str(x).split('[')[0].strip())
-    df['Value'] = pd.to_numeric(df['Value'], errors='coerce')
+    # Keep only Value, Location, Period cols
+    df = pd.concat([df[[country_column, year_column, 'Dim1']], parts], axis=1)
     df.columns = df.columns.str.strip()
+    return compact_frame(df) if compact else df
+
+
+@profiled
+def year_window_usecols(country_column, year_range):
+    """
+    Build a read_csv usecols filter keeping the id column and the year columns inside year_range.
+    :param country_column: id column to keep
+    :param year_range: year range
+    :return: callable column name -> bool
+
+    >>> keep = year_window_usecols('Country Name', (2000, 2001))
+    >>> [column for column in ['Country Name', 'Indicator Name', '1999', '2000', '2001 '] if keep(column)]
+    ['Country Name', '2000', '2001 ']
+    """
+    start_year, end_year = year_range
+
+    def keep_column(column):
+        column = column.strip()
+        return column == country_column or (column.isdigit() and start_year <= int(column) <= end_year)
+    return keep_column
+
+
+@profiled
+def read_wide_csv(file_path, country_column, countries, year_range, skip_rows=None, chunksize=None, encoding=None):
+    """
+    Read a wide (one column per year) csv, keeping only the requested countries and year columns.
+
+    Columns outside year_range are never parsed (11 of 64 World Bank year columns for a +/-5 year window),
+    and year columns come back as float64 (non-numeric cells become NaN).
+    Column names are stripped right after parsing, the way usecols compares them ('2001 ' -> '2001').
+    With chunksize, rows of other countries are also dropped chunk by chunk,
+    so peak memory follows the size of the result instead of the size of the file.
+    :param file_path: csv file path
+    :param country_column: which column to select
+    :param countries: list of countries
+    :param year_range: year range of the year columns to keep
+    :param skip_rows: skip rows until column name occurs
+    :param chunksize: if set, number of rows parsed at a time
+    :param encoding: file encoding (default: utf-8)
+    :return: pd.DataFrame with country_column and the kept year columns
+
+    >>> from io import StringIO
+    >>> csv_data = '''
+    ... Country Name,Indicator Name,2000, 2001 ,2002
+    ... Australia,GDP,1.0,1.1,1.2
+    ... China,GDP,2.0,2.1,2.2
+    ... Canada,GDP,3.0,false,3.2
+    ... '''
+    >>> read_wide_csv(StringIO(csv_data), 'Country Name', ['Australia', 'Canada'], (2001, 2002), chunksize=1)
+      Country Name  2001  2002
+    0    Australia   1.1   1.2
+    1       Canada   NaN   3.2
+    """
+    # 'true'/'false' placeholders (ghg-emissions.csv) are missing values, not booleans
+    with stage('pandas.read_csv'):
+        reader = pd.read_csv(file_path, skiprows=skip_rows, usecols=year_window_usecols(country_column, year_range),
+                             na_values=['true', 'false'], chunksize=chunksize, encoding=encoding)
+        if chunksize:
+            chunks = []
+            with reader:
+                for chunk in reader:
+                    chunk.columns = chunk.columns.str.strip()
+                    chunks.append(chunk[chunk[country_column].isin(countries)])
+            df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=[country_column])
+    if not chunksize:
+        reader.columns = reader.columns.str.strip()
+        df = filter_by_country(reader, country_column, countries).copy()
+
+    year_columns = [col for col in df.columns if col != country_column]
+    df[year_columns] = df[year_columns].apply(pd.to_numeric, errors='coerce').astype('float64')
     return df
 
 
+@profiled
+@cached_preprocess
 def preprocess_csv_type3(
         file_path, country_column, countries, year_column, year_range,
-        skip_rows=None, value_column=None, convert_to_million=False, convert_to_billion=False, column_label=None):
+        skip_rows=None, value_column=None, convert_to_million=False, convert_to_billion=False, column_label=None,
+        chunksize=None, compact=False, encoding=None):
     """
     To process csv type 3, which doesn't have a column named Date, but every year as 1 column (the WorldBank csvs).
     :param file_path: csv file path
@@ -232,6 +550,9 @@ def preprocess_csv_type3(
     :param convert_to_million: whether to convert values to millions
     :param convert_to_billion: whether to convert values to billions
     :param column_label: new label for the column
+    :param chunksize: if set, stream the file this many rows at a time (see read_wide_csv)
+    :param compact: return a compact_frame (categorical names, int16 years, float32 values)
+    :param encoding: file encoding (default: utf-8)
     :return: pd.DataFrame
 
     >>> import pandas as pd
@@ -258,13 +579,13 @@ def preprocess_csv_type3(
     1    Australia  2001  1.1
     2    Australia  2002  1.2
     """
-    df = pd.read_csv(file_path, skiprows=skip_rows)
-    df = filter_by_country(df, country_column, countries)
+    df = read_wide_csv(file_path, country_column, countries, year_range, skip_rows, chunksize, encoding)
 
     year_columns = [col for col in df.columns if col.isdigit()]  # col name?
 
-    df = pd.melt(df, id_vars=[country_column], value_vars=year_columns,
-                 var_name=year_column, value_name='Value')  # wide -> long table
+    with stage('pandas.melt', len(df)):
+        df = pd.melt(df, id_vars=[country_column], value_vars=year_columns,
+                     var_name=year_column, value_name='Value')  # wide -> long table
 
     df[year_column] = pd.to_numeric(df[year_column], errors='coerce')
     df = filter_by_year_range(df, year_column, year_range)
@@ -279,16 +600,109 @@ def preprocess_csv_type3(
             column_label=column_label
         )
     df.columns = df.columns.str.strip()
-    return df
+    return compact_frame(df) if compact else df
 
 
-def preprocess_special_csv(file_path, year_column, year_range, skip_rows=None):
+@profiled
+def preprocess_csv_type3_batch(
+        file_path, country_column, country_year_ranges, year_column,
+        skip_rows=None, value_column=None, convert_to_million=False, convert_to_billion=False, column_label=None,
+        chunksize=None, compact=False, encoding=None):
+    """
+    Batch version of preprocess_csv_type3: read, filter and melt the file once for every country,
+    then slice out each country's own year range.
+    :param file_path: csv file path
+    :param country_column: which column to select
+    :param country_year_ranges: dict of country -> year range, e.g. {'Australia': (1995, 2005)}
+    :param year_column: which column to select
+    :param skip_rows: skip rows until column name occurs
+    :param value_column: which column to convert
+    :param convert_to_million: whether to convert values to millions
+    :param convert_to_billion: whether to convert values to billions
+    :param column_label: new label for the column
+    :param chunksize: if set, stream the file this many rows at a time (see read_wide_csv)
+    :param compact: return a compact_frame (categorical names, int16 years, float32 values)
+    :param encoding: file encoding (default: utf-8)
+    :return: dict of country -> pd.DataFrame
+
+    >>> import pandas as pd
+    >>> from io import StringIO
+    >>> csv_data = '''
+    ... Country Name,2000,2001,2002
+    ... Australia,1000000000,1100000000,1200000000
+    ... China,2000000000,2100000000,2200000000
+    ... Canada,3000000000,3100000000,3200000000
+    ... '''
+    >>> test_file = StringIO(csv_data)  # Simulate a CSV file with StringIO
+    >>> result = preprocess_csv_type3_batch(
+    ...     file_path=test_file,
+    ...     country_column="Country Name",
+    ...     country_year_ranges={"Australia": (2000, 2001), "China": (2001, 2002)},
+    ...     year_column="Year",
+    ...     value_column="Value",
+    ...     convert_to_billion=True,
+    ...     column_label="GDP"
+    ... )
+    >>> sorted(result)
+    ['Australia', 'China']
+    >>> result['China']
+      Country Name  Year  GDP
+    0        China  2001  2.1
+    1        China  2002  2.2
+    """
+    if value_column and (convert_to_billion or convert_to_million) and column_label is None:
+        raise ValueError("`column_label` must be provided when converting values.")
+
+    # widest window across countries, so the conversion runs on as few rows as possible
+    start_year = min(year_range[0] for year_range in country_year_ranges.values())
+    end_year = max(year_range[1] for year_range in country_year_ranges.values())
+
+    df = read_wide_csv(file_path, country_column, list(country_year_ranges), (start_year, end_year),
+                       skip_rows, chunksize, encoding)
+
+    year_columns = [col for col in df.columns if col.isdigit()]
+
+    # melt only the union of requested countries, once for the whole file
+    with stage('pandas.melt', len(df)):
+        df = pd.melt(df, id_vars=[country_column], value_vars=year_columns,
+                     var_name=year_column, value_name='Value')
+
+    df[year_column] = pd.to_numeric(df[year_column], errors='coerce')
+    df = filter_by_year_range(df, year_column, (start_year, end_year)).copy()
+
+    if value_column and (convert_to_billion or convert_to_million):
+        df = convert_values(
+            df, value_column,
+            convert_to_billion=convert_to_billion,
+            convert_to_million=convert_to_million,
+            column_label=column_label
+        )
+    df.columns = df.columns.str.strip()
+
+    results = {}
+    groups = dict(list(df.groupby(country_column, sort=False)))
+    for country, year_range in country_year_ranges.items():
+        if country not in groups:
+            print(f"Warning: {country} not found in {country_column}.")
+            results[country] = df.iloc[0:0].reset_index(drop=True)
+            continue
+        country_df = groups[country].sort_values(year_column, kind='stable')
+        results[country] = filter_by_year_range(country_df, year_column, year_range).reset_index(drop=True)
+    if compact:
+        results = {country: compact_frame(country_df) for country, country_df in results.items()}
+    return results
+
+
+@profiled
+@cached_preprocess
+def preprocess_special_csv(file_path, year_column, year_range, skip_rows=None, compact=False):
     """
     Special process for csv which doesn't have a column named Date, and contain only 1 country.
     :param file_path: csv file path
     :param year_column: which column to select
     :param year_range: year range
     :param skip_rows: skip rows until column name occurs
+    :param compact: return a compact_frame (categorical names, int16 years, float32 values)
     :return: pd.DataFrame
 
     >>> import pandas as pd
@@ -311,215 +725,148 @@ def preprocess_special_csv(file_path, year_column, year_range, skip_rows=None):
     2  Unemployment Rate  2004   5.1
     3  Unemployment Rate  2005   5.3
     """
-    df = pd.read_csv(file_path, skiprows=skip_rows, encoding='latin1')
+    with stage('pandas.read_csv'):
+        df = pd.read_csv(file_path, skiprows=skip_rows, encoding='latin1')
 
     df.columns = ['Indicator'] + [str(year) for year in range(2002, 2016)]
-    df = pd.melt(df, id_vars=['Indicator'], var_name=year_column, value_name='Value')
+    with stage('pandas.melt', len(df)):
+        df = pd.melt(df, id_vars=['Indicator'], var_name=year_column, value_name='Value')
     df = df[df['Indicator'].str.contains('Unemployment Rate', case=False, na=False)]
     df[year_column] = pd.to_numeric(df[year_column], errors='coerce')
     df = filter_by_year_range(df, year_column, year_range)
-    return df
+    return compact_frame(df) if compact else df
 
 
-if __name__ == '__main__':
-    AUS_GDP = preprocess_csv_type1(
-        file_path='data/australia-gdp-gross-domestic-product.csv',
-        date_column='Date',
-        year_column='Date',
-        year_range=(1995, 2005),
-        skip_rows=7  # Skip the first 6 rows to start from the correct header
-    )
-    #print(AUS_GDP)   # test success
-
-    CHI_GDP = preprocess_csv_type1(
-        file_path='data/China-gdp.csv',
-        date_column='DATE',
-        year_column='DATE',
-        year_range=(2003, 2013),
-        value_column='MKTGDPCNA646NWDB',
-        skip_rows=0,
-        convert_to_billion=True,
-        column_label='GDP'
-    )
-    #print(CHI_GDP)  # test success
-
-    AUS_FDI = preprocess_csv_type3(
-        file_path='data/Foreign_Direct _Investment.csv',
-        country_column='Country Name',
-        countries=['Australia'],
-        year_column='Year',
-        year_range=(1995,2005),
-        skip_rows=3,
-        value_column='Value',
-        convert_to_billion=True,
-        column_label='FDI'
-    )
-    #print(AUS_FDI)  # test success
-
-    CHI_FDI = preprocess_csv_type3(
-        file_path='data/Foreign_Direct _Investment.csv',
-        country_column='Country Name',
-        countries=['China'],
-        year_column='Year',
-        year_range=(2003,2013),
-        skip_rows=3,
-        value_column='Value',
-        convert_to_billion=True,
-        column_label='FDI'
-    )
-    #print(CHI_FDI)  # test success
-
-    AUS_gov_consume = preprocess_csv_type3(
-        file_path='data/Government_consumption.csv',
-        country_column='Country Name',
-        countries=['Australia'],
-        year_column='Year',
-        year_range=(1995, 2005),
-        skip_rows=3,
-        value_column='Value',
-        convert_to_billion=True,
-        column_label='Gov_Consumption'
-    )
-    #print(AUS_gov_consume)  # test success
-
-    CHI_gov_consume = preprocess_csv_type3(
-        file_path='data/Government_consumption.csv',
-        country_column='Country Name',
-        countries=['China'],
-        year_column='Year',
-        year_range=(2003, 2013),
-        skip_rows=3,
-        value_column='Value',
-        convert_to_billion=True,
-        column_label='Gov_Consumption'
-    )
-    #print(CHI_gov_consume)  # test success
-
-    AUS_tourism = preprocess_csv_type3(
-        file_path='data/tourism_data.csv',
-        country_column='Country Name',
-        countries=['Australia'],
-        year_column='Year',
-        year_range=(1995, 2005),
-        skip_rows=3,
-        value_column='Value',
-        convert_to_million=True,
-        column_label='Tourism'
-    )
-    #print(AUS_tourism)  # test success
-
-    CHI_tourism = preprocess_csv_type3(
-        file_path='data/tourism_data.csv',
-        country_column='Country Name',
-        countries=['China'],
-        year_column='Year',
-        year_range=(2003, 2013),
-        skip_rows=3,
-        value_column='Value',
-        convert_to_million=True,
-        column_label='Tourism'
-    )
-    #print(CHI_tourism)  # test success
-
-    AUS_obesity = preprocess_csv_type2(
-        file_path='data/Prevalence_of_obesity_among_adults.csv',
-        country_column='Location',
-        countries=['Australia'],
-        year_column='Period',
-        year_range=(1995, 2005),
-        skip_rows=0
-    )
-    #print(AUS_obesity)  # test success
-
-    CHI_obesity = preprocess_csv_type2(
-        file_path='data/Prevalence_of_obesity_among_adults.csv',
-        country_column='Location',
-        countries=['China'],
-        year_column='Period',
-        year_range=(2003,2013),
-        skip_rows=0
-    )
-    #print(CHI_obesity)  # test success
-
-    AUS_underweight = preprocess_csv_type2(
-        file_path='data/Prevalence_of_underweight_among_adults.csv',
-        country_column='Location',
-        countries=['Australia'],
-        year_column='Period',
-        year_range=(1995, 2005),
-        skip_rows=0
-    )
-    print(AUS_underweight)  # test success
-
-    CHI_underweight = preprocess_csv_type2(
-        file_path='data/Prevalence_of_obesity_among_adults.csv',
-        country_column='Location',
-        countries=['China'],
-        year_column='Period',
-        year_range=(2003, 2013),
-        skip_rows=0
-    )
-    print(CHI_underweight)  # test success
-
-
-    AUS_GHG_emission = preprocess_csv_type3(
-        file_path='data/ghg-emissions.csv',
-        country_column='Country/Region',
-        countries=['Australia'],
-        year_column='Year',
-        year_range=(1995,2005)
-    )
-    #print(AUS_GHG_emission)  # test success
-
-    CHI_GHG_emission = preprocess_csv_type3(
-        file_path='data/ghg-emissions.csv',
-        country_column='Country/Region',
-        countries=['China'],
-        year_column='Year',
-        year_range=(2003,2013)
-    )
-    #print(CHI_GHG_emission)  # test success
-
-    AUS_renew_energy = preprocess_csv_type3(
-        file_path='data/Renewable_energy_consumption.csv',
-        country_column='Country Name',
-        countries=['Australia'],
-        year_column='Year',
-        year_range=(1995, 2005),
-        skip_rows=3
-    )
-    #print(AUS_renew_energy)  # test success
-
-    CHI_renew_energy = preprocess_csv_type3(
-        file_path='data/Renewable_energy_consumption.csv',
-        country_column='Country Name',
-        countries=['China'],
-        year_column='Year',
-        year_range=(2003, 2013),
-        skip_rows=3
-    )
-    #print(CHI_renew_energy)  # test success
-
-
-    AUS_UR = preprocess_csv_type3(
-        file_path='data/Unemployment_rate_Australia.csv.csv',
-        country_column='Country Name',
-        countries=['Australia'],
-        year_column='Year',
-        year_range=(1995, 2005),
-        skip_rows=4
-    )
-    #print(AUS_UR)  # test success
-
-    CHI_UR = preprocess_special_csv(
-        file_path='data/Unemployment_rate_China.csv',
-        year_column='Year',
-        year_range=(2003, 2013),
-        skip_rows=2
-    )
-    #print(CHI_UR)  # test success
+sniff_bytes = 8192  # layout detection only looks at the start of a file
+
 
+def _is_year(field):
+    return len(field) == 4 and field.isdigit()
 
 
+@profiled
+def sniff_csv_layout(head):
+    """
+    Detect the layout of a csv from its first bytes.
+
+    Layouts: 'worldbank' (metadata preamble + Country Name/Country Code + one column per year),
+    'who' (Location/Period/Dim1 rows), 'dated' (a Date column, e.g. the macrotrends GDP series),
+    'wide' (country column + one column per year, e.g. ghg-emissions.csv) and
+    'indicator_rows' (one indicator per row for a single country, e.g. the China unemployment file).
+    :param head: first bytes (or text) of the file
+    :return: dict with layout, skip_rows (lines before the header), header (column names) and encoding
+
+    >>> head = (b'"Data Source","World Development Indicators",\\n\\n"Last Updated Date","2024-11-13",\\n\\n'
+    ...         b'"Country Name","Country Code","Indicator Name","Indicator Code","1960","1961",\\n')
+    >>> layout = sniff_csv_layout(head)
+    >>> layout['layout'], layout['skip_rows'], layout['header'][:2]
+    ('worldbank', 4, ['Country Name', 'Country Code'])
+    >>> sniff_csv_layout(b'Country/Region,unit,1990,1991,1992\\nChina,MtCO2e,1,2,3\\n')['layout']
+    'wide'
+    >>> sniff_csv_layout(b'Disclaimer\\n\\nDate, GDP (Billions of US $)\\n1960-12-31,3.9\\n')['skip_rows']
+    2
+    """
+    if isinstance(head, str):
+        text, encoding = head, 'utf-8'
+    else:
+        try:
+            text, encoding = head.decode('utf-8-sig'), 'utf-8'
+        except UnicodeDecodeError as error:
+            if error.start >= len(head) - 3:  # multi-byte character cut at the end of the sample
+                text, encoding = head[:error.start].decode('utf-8-sig'), 'utf-8'
+            else:
+                text, encoding = head.decode('latin1'), 'latin1'
+
+    lines = text.splitlines()
+    if len(lines) > 1 and not text.endswith('\n'):
+        lines = lines[:-1]  # last line may be cut by the sample size
+    for line_number, line in enumerate(lines):
+        fields = [field.strip() for field in next(csv.reader([line]), [])]
+        while fields and fields[-1] == '':
+            fields.pop()
+        if not fields:
+            continue
+        years = sum(_is_year(field) for field in fields)
+
+        if fields[:2] == ['Country Name', 'Country Code']:
+            layout = 'worldbank'
+        elif 'Period' in fields and ('Dim1' in fields or 'Location' in fields):
+            layout = 'who'
+        elif fields[0].lower() == 'date':
+            layout = 'dated'
+        elif years >= 3 and fields[0].lower() in ('indicator', 'indicators'):
+            layout = 'indicator_rows'
+        elif years >= 3 and not _is_year(fields[0]):
+            layout = 'wide'
+        else:
+            continue
+        return {'layout': layout, 'skip_rows': line_number, 'header': fields, 'encoding': encoding}
+    raise ValueError("Unknown csv layout: no World Bank, WHO, dated, wide or indicator header found.")
+
+
+@profiled
+def preprocess_csv_auto(file_path, year_range, countries=None, **kwargs):
+    """
+    Detect the layout of a csv and dispatch it to the matching preprocess_csv_* loader.
 
+    Only the first bytes of a file are read for the sniffing; the loader then gets the path itself
+    (so its on-disk cache applies) with the detected skip_rows and encoding. A file-like object is
+    read once and the loader parses the same buffer.
+    :param file_path: csv file path (or a file-like object)
+    :param year_range: year range
+    :param countries: list of countries for multi-country layouts; a dict of country -> year range
+                      uses preprocess_csv_type3_batch for 'worldbank'/'wide' files
+    :param kwargs: extra loader parameters, e.g. value_column, convert_to_billion, column_label;
+                   a parameter the detected loader does not take raises TypeError
+    :return: pd.DataFrame (dict of country -> pd.DataFrame for batch calls)
+
+    >>> from io import StringIO
+    >>> csv_data = '''Country/Region,unit,2000,2001,2002
+    ... Australia,MtCO2e,500.5,510.0,520.0
+    ... China,MtCO2e,4249.7,4459.9,4769.0
+    ... '''
+    >>> preprocess_csv_auto(StringIO(csv_data), (2001, 2002), countries=['China'])
+      Country/Region  Year   Value
+    0          China  2001  4459.9
+    1          China  2002  4769.0
+    >>> preprocess_csv_auto(StringIO('Location,Period,Dim1,Value\\nChina,2001,Male,24.9 [20.1-30.2]\\n'),
+    ...                     (2001, 2001), countries=['China'], keep_bounds=False)
+      Location  Period  Dim1  Value
+    0    China    2001  Male   24.9
+    """
+    if hasattr(file_path, 'read'):
+        data = file_path.read()
+        layout = sniff_csv_layout(data[:sniff_bytes])
+        source = io.StringIO(data) if isinstance(data, str) else io.BytesIO(data)
+    else:
+        with open(file_path, 'rb') as f:
+            layout = sniff_csv_layout(f.read(sniff_bytes))
+        source = file_path
+    skip_rows = layout['skip_rows']
+    encoding = None if isinstance(source, io.StringIO) else layout['encoding']
+
+    if layout['layout'] in ('worldbank', 'wide'):
+        country_column = layout['header'][0]
+        if isinstance(countries, dict):
+            return preprocess_csv_type3_batch(source, country_column, countries, 'Year', skip_rows,
+                                              encoding=encoding, **kwargs)
+        return preprocess_csv_type3(source, country_column, countries, 'Year', year_range, skip_rows,
+                                    encoding=encoding, **kwargs)
+    if layout['layout'] == 'who':
+        return preprocess_csv_type2(source, 'Location', countries, 'Period', year_range, skip_rows,
+                                    encoding=encoding, **kwargs)
+    if layout['layout'] == 'dated':
+        date_column = layout['header'][0]
+        return preprocess_csv_type1(source, date_column, date_column, year_range, skip_rows=skip_rows,
+                                    encoding=encoding, **kwargs)
+    return preprocess_special_csv(source, 'Year', year_range, skip_rows, **kwargs)  # always latin1
+
+
+if __name__ == '__main__':
+    # every input of the study is declared in Pipeline.DATASETS
+    from Pipeline import run_pipeline
 
+    cleaned_data = run_pipeline()
+    for indicator, host_data in cleaned_data.items():
+        for host, df in host_data.items():
+            print(f"{indicator} - {host}: {len(df)} rows")
@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+
+from BetweenCountry import build_panel
+from DataProcess import olympic_hosts, window_years
+
+
+# Event-study alignment of every host at once.
+# The calendar-year panel (Country, Year, Indicator -> Value) is joined to a complete grid of
+# host x indicator x Relative Year, so a missing year is a row with Observed = False and NaN values
+# instead of a placeholder frame of zeros. Growth rates of all series come out of one groupby shift;
+# the grid starts one year before the window, so the first Relative Year has a growth rate too.
+
+
+def calendar_panel(cleaned_data):
+    """
+    Calendar-year panel of run_pipeline output, whose frames hold either the indicator or a 'Value' column.
+
+    :param cleaned_data: Dictionary indicator -> {country: DataFrame with 'Year'}
+    :return: Panel DataFrame from build_panel, indexed by (Country, Year, Indicator)
+
+    >>> import pandas as pd
+    >>> panel = calendar_panel({'GDP': {'Spain': pd.DataFrame({'Year': [1991, 1992], 'Value': [1.0, 2.0]})}})
+    >>> panel['Value'].tolist(), panel.index.names
+    ([1.0, 2.0], FrozenList(['Country', 'Year', 'Indicator']))
+    """
+    renamed = {indicator: {country: df if indicator in df.columns else df.rename(columns={"Value": indicator})
+                           for country, df in frames.items()}
+               for indicator, frames in cleaned_data.items()}
+    return build_panel(renamed, year_column="Year")
+
+
+def event_study_panel(panel, hosts=None, window=window_years, year_column="Year"):
+    """
+    Stack every host and indicator on Relative Year = Year - Host Year.
+
+    :param panel: Panel from build_panel / calendar_panel, or a long DataFrame with
+                  Country, year_column, Indicator and Value columns
+    :param hosts: Dictionary of host country -> host year (default: olympic_hosts)
+    :param window: Relative Years kept on each side of the host year
+    :param year_column: calendar year column of the panel
+    :return: DataFrame with one row per host, indicator and Relative Year in [-window, window]:
+             Country, Host Year, Indicator, Relative Year, Year, Value, Observed, Growth Rate (%), Growth Observed.
+             Observed is False (and Value NaN) when the panel has no value for that year;
+             Growth Observed is False (and the growth rate NaN) when this or the previous year is
+             missing or the previous value is 0.
+
+    >>> import pandas as pd
+    >>> long = pd.DataFrame({
+    ...     'Country': ['A', 'A', 'A', 'A', 'B', 'B'],
+    ...     'Year': [1999, 2000, 2001, 2002, 2004, 2005],
+    ...     'Indicator': 'GDP',
+    ...     'Value': [100.0, 110.0, 121.0, 133.1, 50.0, 55.0]})
+    >>> stacked = event_study_panel(long, hosts={'A': 2001, 'B': 2004}, window=1)
+    >>> stacked[['Country', 'Relative Year', 'Value', 'Observed', 'Growth Rate (%)', 'Growth Observed']]
+      Country  Relative Year  Value  Observed  Growth Rate (%)  Growth Observed
+    0       A             -1  110.0      True             10.0             True
+    1       A              0  121.0      True             10.0             True
+    2       A              1  133.1      True             10.0             True
+    3       B             -1    NaN     False              NaN            False
+    4       B              0   50.0      True              NaN            False
+    5       B              1   55.0      True             10.0             True
+    """
+    hosts = olympic_hosts if hosts is None else hosts
+    long = panel.reset_index() if isinstance(panel.index, pd.MultiIndex) else panel
+    long = long[["Country", year_column, "Indicator", "Value"]].astype({"Country": str, "Indicator": str})
+    long = long.rename(columns={year_column: "Year"})
+
+    missing = [host for host in hosts if host not in set(long["Country"])]
+    if missing:
+        print(f"Warning: no panel data for {', '.join(missing)}, their rows are all unobserved.")
+
+    # complete grid: host x indicator x Relative Year, starting one year early for the first growth rate
+    indicators = list(dict.fromkeys(long["Indicator"]))
+    relative_years = np.arange(-window - 1, window + 1)
+    n_hosts, n_indicators, n_years = len(hosts), len(indicators), len(relative_years)
+    grid = pd.DataFrame({
+        "Country": np.repeat(list(hosts), n_indicators * n_years),
+        "Host Year": np.repeat(np.array(list(hosts.values()), dtype="int64"), n_indicators * n_years),
+        "Indicator": np.tile(np.repeat(indicators, n_years), n_hosts),
+        "Relative Year": np.tile(relative_years, n_hosts * n_indicators),
+    })
+    grid["Year"] = grid["Host Year"] + grid["Relative Year"]
+
+    if long.duplicated(["Country", "Year", "Indicator"]).any():
+        print("Warning: duplicated (country, year, indicator) rows found, keeping the first one.")
+        long = long.drop_duplicates(["Country", "Year", "Indicator"])
+    stacked = grid.merge(long.astype({"Year": "int64"}), on=["Country", "Year", "Indicator"], how="left",
+                         sort=False)
+    values = pd.to_numeric(stacked["Value"], errors="coerce").astype("float64")
+    stacked["Value"] = values
+    stacked["Observed"] = values.notna()
+
+    previous = values.groupby([stacked["Country"], stacked["Indicator"]], sort=False).shift(1)
+    growth_observed = stacked["Observed"] & previous.notna() & (previous != 0)
+    stacked["Growth Rate (%)"] = ((values - previous) / previous * 100).where(growth_observed)
+    stacked["Growth Observed"] = growth_observed
+
+    stacked = stacked[stacked["Relative Year"] >= -window].reset_index(drop=True)
+    stacked["Country"] = pd.Categorical(stacked["Country"], categories=list(hosts))
+    stacked["Indicator"] = pd.Categorical(stacked["Indicator"], categories=indicators)
+    return stacked
+
+
+def event_study_wide(stacked, column="Value", suffixes=None):
+    """
+    One row per Relative Year and one '{indicator}{suffix}' column per indicator and host,
+    the layout load_and_merge_data returns (so the correlation functions of BetweenCountry apply).
+
+    :param stacked: DataFrame from event_study_panel
+    :param column: 'Value' or 'Growth Rate (%)'
+    :param suffixes: Dictionary of host -> column suffix (default: '_{host}')
+    :return: DataFrame with 'Relative Year' followed by the indicator/host columns, NaN where unobserved
+
+    >>> import pandas as pd
+    >>> long = pd.DataFrame({'Country': ['A', 'A', 'B'], 'Year': [2000, 2001, 2004], 'Indicator': 'GDP',
+    ...                      'Value': [1.0, 2.0, 3.0]})
+    >>> event_study_wide(event_study_panel(long, hosts={'A': 2000, 'B': 2004}, window=1))
+       Relative Year  GDP_A  GDP_B
+    0             -1    NaN    NaN
+    1              0    1.0    3.0
+    2              1    2.0    NaN
+    """
+    suffixes = suffixes or {}
+    wide = stacked.pivot_table(index="Relative Year", columns=["Indicator", "Country"], values=column,
+                               aggfunc="first", dropna=False, observed=False)
+    wide = wide.reindex(sorted(stacked["Relative Year"].unique()))
+    wide.columns = [f"{indicator}{suffixes.get(country, f'_{country}')}" for indicator, country in wide.columns]
+    return wide.reset_index()
+
+
+def event_study_coverage(stacked):
+    """
+    Share of observed years of every host and indicator, to see which series the analysis can trust.
+
+    :param stacked: DataFrame from event_study_panel
+    :return: DataFrame host x indicator with the observed share (0 to 1)
+
+    >>> import pandas as pd
+    >>> long = pd.DataFrame({'Country': ['A', 'A'], 'Year': [2000, 2001], 'Indicator': 'GDP', 'Value': [1.0, 2.0]})
+    >>> stacked = event_study_panel(long, hosts={'A': 2000}, window=1)
+    >>> event_study_coverage(stacked)  # doctest: +NORMALIZE_WHITESPACE
+    Indicator       GDP
+    Country
+    A          0.666667
+    """
+    return stacked.pivot_table(index="Country", columns="Indicator", values="Observed", aggfunc="mean",
+                               observed=False)
@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from DataProcess import window_years
+
+
+# Dense (indicator, country, year) float cube of the cleaned data, stored as a .npy file plus a small
+# JSON index ('<name>.index.json': indicator, country and year labels).
+# IndicatorCube.open memory-maps the file read-only: single-label and year-range selections are views
+# into the mapped pages, nothing is parsed or copied, and every process that opens (or unpickles) the
+# cube shares the same pages through the OS page cache instead of loading the csvs again.
+# Missing values are NaN; the year axis is contiguous from the first to the last year of the data.
+
+
+def index_path(path):
+    """Path of the JSON index next to a cube file: cube.npy -> cube.index.json."""
+    return os.path.splitext(path)[0] + ".index.json"
+
+
+def build_cube(panel, path, dtype="float64"):
+    """
+    Materialize a panel into a cube file and its index.
+
+    :param panel: Panel from BetweenCountry.build_panel / EventStudy.calendar_panel, indexed by
+                  (Country, year, Indicator) with a 'Value' column, e.g. calendar_panel(run_pipeline())
+    :param path: .npy file to write (the index goes to index_path(path))
+    :param dtype: 'float64' or 'float32' (half the size)
+    :return: IndicatorCube opened read-only on the written file
+
+    >>> import os, tempfile
+    >>> import pandas as pd
+    >>> from BetweenCountry import build_panel
+    >>> gdp_aus = pd.DataFrame({'Year': [1999, 2000, 2001], 'GDP': [1.0, 2.0, 3.0]})
+    >>> gdp_chn = pd.DataFrame({'Year': [2000, 2002], 'GDP': [5.0, 6.0]})
+    >>> fdi_aus = pd.DataFrame({'Year': [2000, 2001], 'FDI': [0.1, 0.2]})
+    >>> panel = build_panel({'GDP': {'Australia': gdp_aus, 'China': gdp_chn}, 'FDI': {'Australia': fdi_aus}},
+    ...                     year_column='Year')
+    >>> tmp = tempfile.TemporaryDirectory()
+    >>> cube = build_cube(panel, os.path.join(tmp.name, 'cube.npy'))
+    >>> cube.shape, cube.indicators, cube.countries, cube.years
+    ((2, 2, 4), ['GDP', 'FDI'], ['Australia', 'China'], [1999, 2000, 2001, 2002])
+    >>> cube.view('GDP', 'China')
+    memmap([nan,  5., nan,  6.])
+    """
+    long = panel.reset_index()
+    year_column = panel.index.names[1]
+    indicators = [str(label) for label in dict.fromkeys(long["Indicator"])]
+    countries = [str(label) for label in dict.fromkeys(long["Country"])]
+    years = long[year_column].to_numpy(dtype="int64")
+    first_year, last_year = (int(years.min()), int(years.max())) if len(years) else (0, -1)
+
+    indicator_codes = pd.Categorical(long["Indicator"].astype(str), categories=indicators).codes
+    country_codes = pd.Categorical(long["Country"].astype(str), categories=countries).codes
+    shape = (len(indicators), len(countries), last_year - first_year + 1)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    values = np.lib.format.open_memmap(path + ".tmp", mode="w+", dtype=dtype, shape=shape)
+    values[...] = np.nan
+    values[indicator_codes, country_codes, years - first_year] = long["Value"].to_numpy(dtype="float64")
+    values.flush()
+    del values
+    os.replace(path + ".tmp", path)
+
+    index = {"indicators": indicators, "countries": countries, "first_year": first_year, "last_year": last_year,
+             "year_column": year_column, "dtype": np.dtype(dtype).name}
+    with open(index_path(path), "w") as file:
+        json.dump(index, file, indent=1)
+    return IndicatorCube.open(path)
+
+
+class IndicatorCube:
+    """
+    Memory-mapped (indicator, country, year) cube with label lookups.
+
+    Selecting one indicator / country and a year range gives views (no copy); lists of labels
+    use fancy indexing and therefore copy. Pickling only sends the file path, so a cube passed
+    to a process pool is re-mapped, not copied, in every worker.
+
+    >>> import os, pickle, tempfile
+    >>> import numpy as np
+    >>> import pandas as pd
+    >>> from BetweenCountry import build_panel
+    >>> gdp = pd.DataFrame({'Year': [1999, 2000, 2001], 'GDP': [100.0, 110.0, 121.0]})
+    >>> fdi = pd.DataFrame({'Year': [1999, 2000, 2001], 'FDI': [2.0, 3.0, 1.0]})
+    >>> tmp = tempfile.TemporaryDirectory()
+    >>> cube = build_cube(build_panel({'GDP': {'Australia': gdp}, 'FDI': {'Australia': fdi}}, year_column='Year'),
+    ...                   os.path.join(tmp.name, 'cube.npy'))
+    >>> series = cube.series('GDP', 'Australia', years=(2000, 2001))
+    >>> series.tolist(), np.shares_memory(series.to_numpy(), cube.values)
+    ([110.0, 121.0], True)
+    >>> cube.growth('GDP', 'Australia').round(1).tolist()
+    [nan, 10.0, 10.0]
+    >>> cube.country_frame('Australia')  # doctest: +NORMALIZE_WHITESPACE
+              GDP  FDI
+    Year
+    1999    100.0  2.0
+    2000    110.0  3.0
+    2001    121.0  1.0
+    >>> pickle.loads(pickle.dumps(cube)).view('FDI', 'Australia').tolist()
+    [2.0, 3.0, 1.0]
+    """
+
+    def __init__(self, values, indicators, countries, first_year, year_column="Year", path=None):
+        self.values = values
+        self.indicators = list(indicators)
+        self.countries = list(countries)
+        self.first_year = int(first_year)
+        self.year_column = year_column
+        self.path = path
+        self._indicator_position = {label: i for i, label in enumerate(self.indicators)}
+        self._country_position = {label: i for i, label in enumerate(self.countries)}
+
+    @classmethod
+    def open(cls, path, mode="r"):
+        """
+        Memory-map a cube written by build_cube.
+
+        :param path: .npy file
+        :param mode: 'r' (read-only, default), 'r+' (write through) or 'c' (copy-on-write)
+        :return: IndicatorCube
+        """
+        with open(index_path(path)) as file:
+            index = json.load(file)
+        values = np.load(path, mmap_mode=mode)
+        expected = (len(index["indicators"]), len(index["countries"]), index["last_year"] - index["first_year"] + 1)
+        if values.shape != expected:
+            raise ValueError(f"{path} has shape {values.shape}, its index describes {expected}.")
+        return cls(values, index["indicators"], index["countries"], index["first_year"], index["year_column"], path)
+
+    def __reduce__(self):
+        if self.path is None:
+            return super().__reduce__()
+        return IndicatorCube.open, (self.path,)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def years(self):
+        return list(range(self.first_year, self.first_year + self.values.shape[2]))
+
+    def _axis(self, positions, labels, name):
+        if labels is None:
+            return slice(None)
+        if isinstance(labels, (list, tuple)):
+            return [self._axis(positions, label, name) for label in labels]
+        if labels not in positions:
+            raise KeyError(f"{name} '{labels}' is not in the cube.")
+        return positions[labels]
+
+    def _year_slice(self, years):
+        if years is None:
+            return slice(None)
+        start, end = years
+        last = self.first_year + self.values.shape[2] - 1
+        return slice(max(start, self.first_year) - self.first_year, max(min(end, last) - self.first_year + 1, 0))
+
+    def view(self, indicator=None, country=None, years=None):
+        """
+        Values of the selection; a view of the mapped file unless lists of labels are given.
+
+        :param indicator: indicator label, list of labels, or None for all
+        :param country: country label, list of labels, or None for all
+        :param years: (start, end) inclusive, or None for all years
+        :return: Array with the axes that were not fixed by a single label
+        """
+        i = self._axis(self._indicator_position, indicator, "Indicator")
+        c = self._axis(self._country_position, country, "Country")
+        y = self._year_slice(years)
+        if isinstance(i, list) and isinstance(c, list):
+            return self.values[np.ix_(i, c)][..., y]
+        return self.values[i, c, y]
+
+    def _year_index(self, years):
+        selected = self.years[self._year_slice(years)]
+        return pd.Index(selected, name=self.year_column)
+
+    def series(self, indicator, country, years=None):
+        """
+        One indicator of one country as a Series indexed by year (backed by the mapped file).
+        """
+        return pd.Series(self.view(indicator, country, years), index=self._year_index(years),
+                         name=f"{indicator}_{country}", copy=False)
+
+    def frame(self, indicator, countries=None, years=None):
+        """
+        Year x country DataFrame of one indicator (a view when countries is None).
+        """
+        countries = self.countries if countries is None else list(countries)
+        values = self.view(indicator, None if countries == self.countries else countries, years)
+        return pd.DataFrame(values.T, index=self._year_index(years), columns=countries, copy=False)
+
+    def country_frame(self, country, indicators=None, years=None):
+        """
+        Year x indicator DataFrame of one country, the input of its correlation matrix or line plots.
+        """
+        indicators = self.indicators if indicators is None else list(indicators)
+        values = self.view(None if indicators == self.indicators else indicators, country, years)
+        frame = pd.DataFrame(values.T, index=self._year_index(years), columns=indicators, copy=False)
+        frame.columns.name = None
+        return frame
+
+    def growth(self, indicator=None, country=None, years=None):
+        """
+        Year-on-year growth rate (%) of the selection along the year axis; NaN for the first year,
+        after a missing year or after a zero value (no placeholder zeros).
+        """
+        values = self.view(indicator, country, years)
+        growth = np.full(values.shape, np.nan)
+        previous = values[..., :-1]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            growth[..., 1:] = np.where(previous != 0, (values[..., 1:] - previous) / previous * 100, np.nan)
+        return growth
+
+    def aligned(self, indicator, hosts, window=window_years):
+        """
+        Relative Year x host DataFrame of one indicator around each host year (a gathered copy).
+
+        :param indicator: indicator label
+        :param hosts: Dictionary of host country -> host year
+        :param window: years kept before and after each host year
+        :return: DataFrame indexed by 'Relative Year', NaN outside the cube's years
+        """
+        relative_years = np.arange(-window, window + 1)
+        hosts = {host: year for host, year in hosts.items() if host in self._country_position}
+        positions = np.array([self._country_position[host] for host in hosts], dtype="int64")
+        offsets = np.array(list(hosts.values()), dtype="int64")[:, None] + relative_years - self.first_year
+        inside = (offsets >= 0) & (offsets < self.values.shape[2])
+
+        clipped = np.clip(offsets, 0, self.values.shape[2] - 1)
+        gathered = self.values[self._indicator_position[indicator]][positions[:, None], clipped]
+        gathered = np.where(inside, gathered, np.nan)
+        return pd.DataFrame(gathered.T, index=pd.Index(relative_years, name="Relative Year"), columns=list(hosts))
+
+
+def main(argv=None):
+    """
+    Command line entry point: run the pipeline and write its cube.
+
+    Example: python IndicatorCube.py .cache/cube/indicators.npy --dtype float32
+    """
+    from EventStudy import calendar_panel
+    from Pipeline import run_pipeline
+
+    parser = argparse.ArgumentParser(description="Build the (indicator, country, year) cube of the cleaned data.")
+    parser.add_argument("path", help=".npy file to write (the index is written next to it)")
+    parser.add_argument("--dtype", default="float64", choices=["float64", "float32"])
+    args = parser.parse_args(argv)
+
+    cube = build_cube(calendar_panel(run_pipeline()), args.path, args.dtype)
+    print(f"Wrote {args.path}: {len(cube.indicators)} indicators x {len(cube.countries)} countries x "
+          f"{len(cube.years)} years")
+    return cube
+
+
+if __name__ == '__main__':
+    main()
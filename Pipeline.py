@@ -0,0 +1,596 @@
+import csv
+import hashlib
+import json
+import os
+import pickle
+import re
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import pandas as pd
+
+import BetweenCountry
+import DataProcess
+from BetweenCountry import batched_correlation, cached_growth_rate_view, export_figures, plot_correlation_heatmap
+from DataCache import file_digest
+from DataProcess import (olympic_hosts, window_years, filter_by_year_range, preprocess_csv_type1,
+                         preprocess_csv_type2, preprocess_csv_type3_batch, preprocess_special_csv, sniff_bytes)
+
+
+# Declarative description of every input of the study and a small DAG executor that loads it.
+# DATASETS says *what* is needed (indicator -> file, loader, parameters); build_pipeline turns it into
+# one load node per distinct file read and one select node per (indicator, host), and run_dag executes
+# the graph level by level, running the independent nodes of a level concurrently.
+# run_incremental adds growth, correlation and figure nodes and only recomputes the nodes whose
+# fingerprint (code + parameters + source file content + upstream fingerprints) changed since the last run.
+# run_hosts_parallel reads every file once, then runs the per-host part of the graph
+# (select -> growth -> correlation -> heatmap) in a process pool, one task per host.
+
+STATE_DIR = os.environ.get('OLYMPIC_PIPELINE_DIR', os.path.join('.cache', 'pipeline'))
+
+# indicator: name used downstream (BetweenCountry metrics)
+# file / loader / params: how to read it; identical (file, loader, params) are read only once
+# hosts: hosts covered by this file (default: every olympic host)
+# names: host -> name used in the file, when it differs from the World Bank 'Country Name'
+# optional: missing file only warns (WHO downloads are not bundled in data/)
+DATASETS = [
+    # GDP per capita (current US$), FDI and government consumption in % of GDP: no unit conversion
+    {"indicator": "GDP", "file": "data/GDP.csv", "loader": "worldbank", "params": {"skip_rows": 3}},
+    {"indicator": "FDI", "file": "data/FDI.csv", "loader": "worldbank", "params": {"skip_rows": 3}},
+    {"indicator": "Gov_Consumption", "file": "data/Government_consumption.csv", "loader": "worldbank",
+     "params": {"skip_rows": 3}},
+    {"indicator": "Tourism", "file": "data/tourism_data.csv", "loader": "worldbank",
+     "params": {"skip_rows": 3, "value_column": "Value", "convert_to_million": True, "column_label": "Tourism"}},
+    {"indicator": "Renew_Energy", "file": "data/Renewable_energy_consumption.csv", "loader": "worldbank",
+     "params": {"skip_rows": 3}},
+    {"indicator": "GHG_Emission", "file": "data/ghg-emissions.csv", "loader": "worldbank",
+     "params": {"country_column": "Country/Region"}, "names": {"Korea, Rep.": "South Korea"}},
+    {"indicator": "Unemployment", "file": "data/Unemployment_rate.csv", "loader": "worldbank",
+     "params": {"skip_rows": 3}, "hosts": [host for host in olympic_hosts if host != "China"]},
+    {"indicator": "Unemployment", "file": "data/Unemployment_rate_China.csv", "loader": "special",
+     "params": {"skip_rows": 2}, "hosts": ["China"]},
+    {"indicator": "Obesity", "file": "data/Prevalence_of_obesity_among_adults.csv", "loader": "who",
+     "params": {"skip_rows": 0, "column_label": "Obesity"}, "optional": True, "names": {
+         "Korea, Rep.": "Republic of Korea",
+         "United States": "United States of America",
+         "United Kingdom": "United Kingdom of Great Britain and Northern Ireland"}},
+    {"indicator": "Underweight", "file": "data/Prevalence_of_underweight_among_adults.csv", "loader": "who",
+     "params": {"skip_rows": 0, "column_label": "Underweight"}, "optional": True, "names": {
+         "Korea, Rep.": "Republic of Korea",
+         "United States": "United States of America",
+         "United Kingdom": "United Kingdom of Great Britain and Northern Ireland"}},
+]
+
+
+def _union_range(year_ranges):
+    return min(start for start, _ in year_ranges), max(end for _, end in year_ranges)
+
+
+def _load_worldbank(file_path, year_ranges, country_column="Country Name", **params):
+    """One read of a wide (one column per year) csv for every requested country."""
+    return preprocess_csv_type3_batch(file_path, country_column, year_ranges, "Year", **params)
+
+
+def _load_who(file_path, year_ranges, country_column="Location", sex="Both sexes", column_label="Value", **params):
+    """
+    One read of a WHO 'Period' csv for every requested country, split afterwards.
+    Only the `sex` rows of Dim1 are kept and the columns are renamed to Year / column_label,
+    so the frames line up with the World Bank ones.
+
+    >>> import os, tempfile
+    >>> tmp = tempfile.TemporaryDirectory()
+    >>> path = os.path.join(tmp.name, 'who.csv')
+    >>> with open(path, 'w') as f:
+    ...     _ = f.write('Location,Period,Dim1,Value\\n' + ''.join(
+    ...         f'Spain,{year},{sex},{value} [1.0-2.0]\\n' for year, value in [(1991, 1.5), (1992, 1.6)]
+    ...         for sex in ['Both sexes', 'Male']))
+    >>> _load_who(path, {'Spain': (1991, 1992)}, column_label='Obesity')['Spain'][['Year', 'Obesity']]
+       Year  Obesity
+    0  1991      1.5
+    2  1992      1.6
+    """
+    df = preprocess_csv_type2(file_path, country_column, list(year_ranges), "Period",
+                              _union_range(year_ranges.values()), **params)
+    df = df[df["Dim1"] == sex].drop(columns="Dim1").rename(columns={"Period": "Year", "Value": column_label})
+    return {country: filter_by_year_range(df[df[country_column] == country], "Year", year_range)
+            for country, year_range in year_ranges.items()}
+
+
+def _load_special(file_path, year_ranges, **params):
+    """Single-country file (China unemployment)."""
+    df = preprocess_special_csv(file_path, "Year", _union_range(year_ranges.values()), **params)
+    return {country: filter_by_year_range(df, "Year", year_range) for country, year_range in year_ranges.items()}
+
+
+def _load_dated(file_path, year_ranges, date_column="Date", **params):
+    """Single-country file with a 'Date' column (macrotrends exports)."""
+    df = preprocess_csv_type1(file_path, date_column, date_column, _union_range(year_ranges.values()), **params)
+    return {country: filter_by_year_range(df, date_column, year_range)
+            for country, year_range in year_ranges.items()}
+
+
+# loader name in DATASETS -> function(file_path, {country: year_range}, **params) -> {country: DataFrame}
+LOADERS = {
+    "worldbank": _load_worldbank,
+    "who": _load_who,
+    "special": _load_special,
+    "dated": _load_dated,
+}
+
+
+def _select(loaded, name):
+    return loaded[name]
+
+
+def check_inputs(datasets):
+    """
+    Fail fast on missing inputs, before anything is read.
+
+    :param datasets: list of dataset specs (see DATASETS)
+    :return: the datasets whose file exists (missing optional ones are dropped with a warning)
+
+    >>> check_inputs([{"indicator": "X", "file": "missing.csv", "loader": "who", "optional": True}])
+    Warning: optional input missing.csv for X not found, skipped.
+    []
+    >>> check_inputs([{"indicator": "X", "file": "missing.csv", "loader": "who"}])
+    Traceback (most recent call last):
+    ...
+    FileNotFoundError: Missing pipeline inputs: missing.csv (X)
+    """
+    available, missing = [], []
+    for dataset in datasets:
+        if dataset["loader"] not in LOADERS:
+            raise ValueError(f"Unknown loader '{dataset['loader']}' for {dataset['indicator']}.")
+        if os.path.isfile(dataset["file"]):
+            available.append(dataset)
+        elif dataset.get("optional"):
+            print(f"Warning: optional input {dataset['file']} for {dataset['indicator']} not found, skipped.")
+        else:
+            missing.append(f"{dataset['file']} ({dataset['indicator']})")
+    if missing:
+        raise FileNotFoundError("Missing pipeline inputs: " + ", ".join(missing))
+    return available
+
+
+def build_pipeline(datasets=None, hosts=None, window=window_years, compact=False):
+    """
+    Resolve the dataset specs into a DAG of load and select nodes.
+
+    Datasets sharing the same file, loader and parameters become a single load node covering all of their hosts.
+
+    :param datasets: list of dataset specs (default: DATASETS)
+    :param hosts: Dictionary of host country -> host year (default: olympic_hosts)
+    :param window: years kept before and after each host year
+    :param compact: load memory-compact frames (see DataProcess.compact_frame)
+    :return: (nodes, outputs): nodes is {node name: (function, dependencies, kwargs)},
+             outputs is {(indicator, host): select node name}
+
+    >>> specs = [{"indicator": "A", "file": "data/GDP.csv", "loader": "worldbank", "params": {"skip_rows": 3}},
+    ...          {"indicator": "B", "file": "data/GDP.csv", "loader": "worldbank", "params": {"skip_rows": 3}}]
+    >>> nodes, outputs = build_pipeline(specs, hosts={"Australia": 2000, "China": 2008})
+    >>> sorted(name for name in nodes if name.startswith("load"))
+    ['load:data/GDP.csv:worldbank#0']
+    >>> nodes['load:data/GDP.csv:worldbank#0'][2]['year_ranges']
+    {'Australia': (1995, 2005), 'China': (2003, 2013)}
+    >>> outputs[("B", "China")]
+    'select:B:China'
+    """
+    datasets = DATASETS if datasets is None else datasets
+    hosts = olympic_hosts if hosts is None else hosts
+
+    nodes, outputs, load_nodes = {}, {}, {}
+    for dataset in datasets:
+        params = dataset.get("params", {})
+        read_key = (dataset["file"], dataset["loader"], repr(sorted(params.items())))
+        if read_key not in load_nodes:
+            name = f"load:{dataset['file']}:{dataset['loader']}#{len(load_nodes)}"
+            load_nodes[read_key] = name
+            nodes[name] = (LOADERS[dataset["loader"]], [],
+                           {"file_path": dataset["file"], "year_ranges": {}, **params, "compact": compact})
+        load_name = load_nodes[read_key]
+        year_ranges = nodes[load_name][2]["year_ranges"]
+
+        names = dataset.get("names", {})
+        for host in dataset.get("hosts", hosts):
+            if host not in hosts:
+                continue
+            file_name = names.get(host, host)
+            year_ranges[file_name] = (hosts[host] - window, hosts[host] + window)
+            select_name = f"select:{dataset['indicator']}:{host}"
+            nodes[select_name] = (_select, [load_name], {"name": file_name})
+            outputs[(dataset["indicator"], host)] = select_name
+    return nodes, outputs
+
+
+def dag_levels(nodes):
+    """
+    Group nodes into levels: every node only depends on nodes of earlier levels.
+
+    :param nodes: {node name: (function, dependencies, kwargs)}
+    :return: list of lists of node names
+
+    >>> dag_levels({"a": (None, [], {}), "b": (None, ["a"], {}), "c": (None, [], {}), "d": (None, ["b", "c"], {})})
+    [['a', 'c'], ['b'], ['d']]
+    """
+    remaining = {name: set(dependencies) for name, (_, dependencies, _) in nodes.items()}
+    for name, dependencies in remaining.items():
+        unknown = dependencies - set(nodes)
+        if unknown:
+            raise ValueError(f"Node {name} depends on unknown nodes: {sorted(unknown)}")
+
+    levels, done = [], set()
+    while remaining:
+        level = [name for name, dependencies in remaining.items() if dependencies <= done]
+        if not level:
+            raise ValueError(f"Cycle between nodes: {sorted(remaining)}")
+        levels.append(level)
+        done.update(level)
+        for name in level:
+            del remaining[name]
+    return levels
+
+
+def run_dag(nodes, max_workers=None, results=None):
+    """
+    Execute the DAG level by level; the nodes of one level run concurrently in a thread pool.
+
+    The first failing node stops the run: its not yet started siblings are cancelled and the error is raised.
+
+    :param nodes: {node name: (function, dependencies, kwargs)}; function receives the dependency results
+                  positionally, followed by kwargs
+    :param max_workers: threads per level; 1 runs everything in order in this thread
+    :param results: already known {node name: result}; these nodes are not run again
+    :return: {node name: result}
+
+    >>> nodes = {"x": (lambda: 2, [], {}), "y": (lambda: 3, [], {}), "sum": (lambda a, b: a + b, ["x", "y"], {})}
+    >>> run_dag(nodes)["sum"]
+    5
+    """
+    results = dict(results or {})
+    for level in dag_levels(nodes):
+        level = [name for name in level if name not in results]
+        if not level:
+            continue
+
+        def run(name):
+            function, dependencies, kwargs = nodes[name]
+            return function(*[results[dependency] for dependency in dependencies], **kwargs)
+
+        if max_workers == 1 or len(level) == 1:
+            results.update({name: run(name) for name in level})
+            continue
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {name: executor.submit(run, name) for name in level}
+            try:
+                results.update({name: future.result() for name, future in futures.items()})
+            except BaseException:
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+    return results
+
+
+def run_pipeline(datasets=None, hosts=None, window=window_years, max_workers=None, compact=False):
+    """
+    Check, resolve and execute the dataset registry.
+
+    :param datasets: list of dataset specs (default: DATASETS)
+    :param hosts: Dictionary of host country -> host year (default: olympic_hosts)
+    :param window: years kept before and after each host year
+    :param max_workers: threads per DAG level
+    :param compact: load memory-compact frames (categorical names, int16 years, float32 values)
+    :return: Dictionary indicator -> {host: DataFrame}, the layout build_panel expects
+    """
+    datasets = check_inputs(DATASETS if datasets is None else datasets)
+    nodes, outputs = build_pipeline(datasets, hosts, window, compact)
+    results = run_dag(nodes, max_workers)
+
+    cleaned_data = {}
+    for (indicator, host), node in outputs.items():
+        cleaned_data.setdefault(indicator, {})[host] = results[node]
+    return cleaned_data
+
+
+def source_stamp(file_path):
+    """
+    Change stamp of a source file: the World Bank 'Last Updated Date' header (None for other files)
+    and the content digest.
+
+    :param file_path: csv file path
+    :return: dict with 'last_updated' and 'digest'
+    """
+    with open(file_path, 'rb') as f:
+        head = f.read(sniff_bytes).decode('utf-8-sig', errors='replace')
+    last_updated = None
+    for row in csv.reader(head.splitlines()[:10]):
+        if len(row) >= 2 and row[0].strip() == 'Last Updated Date':
+            last_updated = row[1].strip()
+            break
+    return {"last_updated": last_updated, "digest": file_digest(file_path)}
+
+
+def _code_digest():
+    digest = hashlib.sha256()
+    for module in (DataProcess, BetweenCountry, sys.modules[__name__]):
+        digest.update(file_digest(module.__file__).encode())
+    return digest.hexdigest()
+
+
+def node_fingerprints(nodes, sources):
+    """
+    Fingerprint every node from the code, its function and parameters, the stamp of the file it reads
+    and the fingerprints of its dependencies, so a change anywhere upstream changes everything downstream.
+
+    :param nodes: {node name: (function, dependencies, kwargs)}
+    :param sources: {file path: source_stamp}
+    :return: {node name: hex digest}
+    """
+    code = _code_digest()
+    fingerprints = {}
+    for level in dag_levels(nodes):
+        for name in level:
+            function, dependencies, kwargs = nodes[name]
+            payload = {
+                "code": code,
+                "function": f"{function.__module__}.{function.__qualname__}",
+                "kwargs": kwargs,
+                "source": sources.get(kwargs.get("file_path"), {}).get("digest"),
+                "dependencies": [fingerprints[dependency] for dependency in dependencies],
+            }
+            fingerprints[name] = hashlib.sha256(json.dumps(payload, sort_keys=True, default=repr).encode()).hexdigest()
+    return fingerprints
+
+
+def _result_path(state_dir, name):
+    return os.path.join(state_dir, hashlib.sha256(name.encode()).hexdigest()[:24] + '.pkl')
+
+
+def run_dag_incremental(nodes, state_dir=None, max_workers=None):
+    """
+    Execute the DAG, reusing the stored output of every node whose fingerprint did not change.
+
+    The manifest (state_dir/manifest.json) keeps the source stamps and node fingerprints of the last run;
+    node outputs are pickled next to it.
+
+    :param nodes: {node name: (function, dependencies, kwargs)}; load nodes carry a 'file_path' kwarg
+    :param state_dir: folder of the manifest and stored outputs (default: STATE_DIR)
+    :param max_workers: threads per DAG level
+    :return: (results, recomputed): {node name: result} and the sorted names of the nodes that were run
+
+    >>> import tempfile
+    >>> calls = []
+    >>> nodes = {"x": (lambda: calls.append("x") or 2, [], {}), "y": (lambda a: calls.append("y") or a + 1, ["x"], {})}
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     first = run_dag_incremental(nodes, tmp)[1]
+    ...     second = run_dag_incremental(nodes, tmp)
+    >>> first, second[1], second[0]["y"], calls
+    (['x', 'y'], [], 3, ['x', 'y'])
+    >>> empty_figure = {"figure": (lambda save_path: None, [], {"save_path": "never-written.png"})}
+    >>> with tempfile.TemporaryDirectory() as tmp:
+    ...     _ = run_dag_incremental(empty_figure, tmp)
+    ...     run_dag_incremental(empty_figure, tmp)[1]
+    []
+    """
+    state_dir = state_dir or STATE_DIR
+    os.makedirs(state_dir, exist_ok=True)
+    manifest_path = os.path.join(state_dir, 'manifest.json')
+    manifest = {"sources": {}, "nodes": {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    sources = {kwargs["file_path"]: source_stamp(kwargs["file_path"])
+               for _, _, kwargs in nodes.values() if "file_path" in kwargs}
+    for file_path, stamp in sources.items():
+        previous = manifest["sources"].get(file_path)
+        if previous and previous["digest"] != stamp["digest"]:
+            print(f"{file_path} changed (Last Updated Date {previous['last_updated']} -> {stamp['last_updated']}).")
+
+    fingerprints = node_fingerprints(nodes, sources)
+    stale = {name for name in nodes if manifest["nodes"].get(name) != fingerprints[name]
+             or not os.path.exists(_result_path(state_dir, name))}
+
+    known = {}
+    for name, (_, _, kwargs) in nodes.items():
+        if name in stale:
+            continue
+        with open(_result_path(state_dir, name), 'rb') as f:
+            result = pickle.load(f)
+        # a figure node stores the path it wrote, or None when there was nothing to draw (no file expected)
+        if result is not None and "save_path" in kwargs and not os.path.exists(kwargs["save_path"]):
+            stale.add(name)
+        else:
+            known[name] = result
+    results = run_dag(nodes, max_workers, known)
+
+    for name in stale:
+        tmp_path = f'{_result_path(state_dir, name)}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(results[name], f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, _result_path(state_dir, name))
+    manifest = {"sources": sources, "nodes": fingerprints}
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return results, sorted(stale)
+
+
+def _growth(df, indicator, host_year):
+    """Growth rates and Relative Year of one selected frame (see growth_rate_view)."""
+    value_column = indicator if indicator in df.columns else "Value"
+    try:
+        return cached_growth_rate_view(df, rename_dict={value_column: indicator}, host_year=host_year,
+                                       metric_column=indicator)
+    except ValueError as error:
+        print(f"Warning: no growth rates for {indicator} around {host_year}: {error}")
+        return pd.DataFrame(columns=["Year", indicator, "Growth Rate (%)", "Relative Year"])
+
+
+def _host_correlation(*growth_frames, indicators):
+    """Correlation matrix of the indicator levels of one host over the Relative Years."""
+    columns = {}
+    for indicator, df in zip(indicators, growth_frames):
+        if indicator in df.columns and "Relative Year" in df.columns and len(df) > 1:
+            series = pd.to_numeric(df.set_index("Relative Year")[indicator], errors="coerce")
+            columns[indicator] = series[~series.index.duplicated()]
+    if len(columns) < 2:
+        return pd.DataFrame()
+    merged = pd.DataFrame(columns)
+    matrix = batched_correlation(merged.to_numpy(dtype="float64"))
+    return pd.DataFrame(matrix, index=merged.columns, columns=merged.columns)
+
+
+_figure_lock = threading.Lock()  # pyplot state is global: figure nodes render one at a time
+
+
+def _render_heatmap(matrix, title, save_path):
+    with _figure_lock:
+        written = export_figures([(plot_correlation_heatmap, {"correlation_matrix": matrix, "title": title},
+                                   save_path)], max_workers=1)
+    return written[0] if written else None
+
+
+def add_analysis_nodes(nodes, outputs, hosts=None, output_dir=None, file_format="png"):
+    """
+    Add growth-rate, correlation and (with output_dir) heatmap nodes downstream of the select nodes.
+
+    :param nodes: DAG from build_pipeline, extended in place
+    :param outputs: {(indicator, host): select node name} from build_pipeline
+    :param hosts: Dictionary of host country -> host year (default: olympic_hosts)
+    :param output_dir: folder for the heatmaps; None adds no figure nodes
+    :param file_format: 'png', 'svg' or 'pdf'
+    :return: {'growth': {(indicator, host): node}, 'correlation': {host: node}, 'figures': {host: node}}
+    """
+    hosts = olympic_hosts if hosts is None else hosts
+    analysis = {"growth": {}, "correlation": {}, "figures": {}}
+    for (indicator, host), select_name in outputs.items():
+        name = f"growth:{indicator}:{host}"
+        nodes[name] = (_growth, [select_name], {"indicator": indicator, "host_year": hosts[host]})
+        analysis["growth"][(indicator, host)] = name
+
+    for host in dict.fromkeys(host for _, host in outputs):
+        indicators = [indicator for indicator, growth_host in analysis["growth"] if growth_host == host]
+        name = f"correlation:{host}"
+        nodes[name] = (_host_correlation, [analysis["growth"][(indicator, host)] for indicator in indicators],
+                       {"indicators": indicators})
+        analysis["correlation"][host] = name
+        if output_dir:
+            figure_name = f"figure:{host}"
+            file_name = re.sub(r"\W+", "_", host).strip("_")
+            save_path = os.path.join(output_dir, f"correlation_{file_name}.{file_format}")
+            nodes[figure_name] = (_render_heatmap, [name],
+                                  {"title": f"{host} indicator correlations", "save_path": save_path})
+            analysis["figures"][host] = figure_name
+    return analysis
+
+
+def run_incremental(datasets=None, hosts=None, window=window_years, state_dir=None, output_dir=None,
+                    file_format="png", max_workers=None, compact=False):
+    """
+    Incremental build: load, growth rates, per-host correlation matrices and heatmaps,
+    recomputing only what depends on changed source files (or changed code / parameters).
+
+    :param datasets: list of dataset specs (default: DATASETS)
+    :param hosts: Dictionary of host country -> host year (default: olympic_hosts)
+    :param window: years kept before and after each host year
+    :param state_dir: folder of the manifest and stored node outputs (default: STATE_DIR)
+    :param output_dir: folder for the heatmaps; None renders no figures
+    :param file_format: 'png', 'svg' or 'pdf'
+    :param max_workers: threads per DAG level
+    :param compact: load memory-compact frames
+    :return: dict with 'data' and 'growth' (indicator -> {host: DataFrame}), 'correlation' (host -> matrix),
+             'figures' (host -> written path) and 'recomputed' (names of the nodes that were run)
+    """
+    hosts = olympic_hosts if hosts is None else hosts
+    datasets = check_inputs(DATASETS if datasets is None else datasets)
+    nodes, outputs = build_pipeline(datasets, hosts, window, compact)
+    analysis = add_analysis_nodes(nodes, outputs, hosts, output_dir, file_format)
+    results, recomputed = run_dag_incremental(nodes, state_dir, max_workers)
+
+    build = {"data": {}, "growth": {}, "recomputed": recomputed}
+    for (indicator, host), node in outputs.items():
+        build["data"].setdefault(indicator, {})[host] = results[node]
+        build["growth"].setdefault(indicator, {})[host] = results[analysis["growth"][(indicator, host)]]
+    build["correlation"] = {host: results[node] for host, node in analysis["correlation"].items()}
+    build["figures"] = {host: results[node] for host, node in analysis["figures"].items()
+                        if results[node] is not None}
+    return build
+
+
+_host_inputs = {}  # loaded files, shared read-only by the host worker processes (set by _init_host_worker)
+
+
+def _init_host_worker(loaded, headless):
+    """Process pool initializer: receive the loaded files once per worker instead of once per host."""
+    _host_inputs["loaded"] = loaded
+    if headless:
+        BetweenCountry._use_headless_backend()
+
+
+def _run_host_nodes(host_nodes):
+    """Run one host's part of the DAG on the shared loaded files; return only the nodes computed here."""
+    loaded = _host_inputs["loaded"]
+    results = run_dag(host_nodes, max_workers=1, results=loaded)
+    return {name: results[name] for name in host_nodes if name not in loaded}
+
+
+def run_hosts_parallel(datasets=None, hosts=None, window=window_years, output_dir=None, file_format="png",
+                       max_workers=None, compact=False):
+    """
+    Load, growth rates, correlation matrix and heatmap of every host, the hosts spread over a process pool.
+
+    The files are read once in this process (one thread per file, as in run_pipeline) and handed to every
+    worker through the pool initializer. Each task then runs the select, growth, correlation and figure nodes
+    of one host. Results are merged in host order, so they do not depend on which worker finishes first.
+
+    :param datasets: list of dataset specs (default: DATASETS)
+    :param hosts: Dictionary of host country -> host year (default: olympic_hosts)
+    :param window: years kept before and after each host year
+    :param output_dir: folder for the heatmaps; None renders no figures
+    :param file_format: 'png', 'svg' or 'pdf'
+    :param max_workers: number of processes (default: all cores); 1 runs every host in this process
+    :param compact: load memory-compact frames
+    :return: dict with 'data' and 'growth' (indicator -> {host: DataFrame}), 'correlation' (host -> matrix)
+             and 'figures' (host -> path), the layout of run_incremental
+    """
+    hosts = olympic_hosts if hosts is None else hosts
+    datasets = check_inputs(DATASETS if datasets is None else datasets)
+    nodes, outputs = build_pipeline(datasets, hosts, window, compact)
+    analysis = add_analysis_nodes(nodes, outputs, hosts, output_dir, file_format)
+
+    load_nodes = {name: node for name, node in nodes.items() if not node[1]}
+    loaded = run_dag(load_nodes)
+
+    host_order = list(dict.fromkeys(host for _, host in outputs))
+    tasks = []
+    for host in host_order:
+        host_nodes = dict(load_nodes)
+        for (indicator, output_host), select_name in outputs.items():
+            if output_host == host:
+                growth_name = analysis["growth"][(indicator, host)]
+                host_nodes[select_name], host_nodes[growth_name] = nodes[select_name], nodes[growth_name]
+        for name in (analysis["correlation"][host], analysis["figures"].get(host)):
+            if name is not None:
+                host_nodes[name] = nodes[name]
+        tasks.append(host_nodes)
+
+    if max_workers == 1 or len(tasks) <= 1:
+        _init_host_worker(loaded, headless=False)
+        try:
+            host_results = [_run_host_nodes(task) for task in tasks]
+        finally:
+            _host_inputs.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_host_worker,
+                                 initargs=(loaded, output_dir is not None)) as executor:
+            host_results = list(executor.map(_run_host_nodes, tasks))  # map keeps the host order
+
+    results = {name: result for host_result in host_results for name, result in host_result.items()}
+    build = {"data": {}, "growth": {}}
+    for (indicator, host), node in outputs.items():
+        build["data"].setdefault(indicator, {})[host] = results[node]
+        build["growth"].setdefault(indicator, {})[host] = results[analysis["growth"][(indicator, host)]]
+    build["correlation"] = {host: results[analysis["correlation"][host]] for host in host_order}
+    build["figures"] = {host: results[analysis["figures"][host]] for host in host_order
+                        if host in analysis["figures"] and results[analysis["figures"][host]] is not None}
+    return build
@@ -0,0 +1,312 @@
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+
+# Opt-in instrumentation of the DataProcess and BetweenCountry functions.
+# @profiled wraps a function and `with stage(name):` marks a block inside one (pd.read_csv, pd.melt, savefig).
+# While no trace is active both only check one module global, so they can stay in the code for good.
+# Inside `with profiling() as trace:` every call records wall time, self time (without nested calls),
+# rows in/out and, with memory=True, its tracemalloc peak. The trace is written as plain JSON records,
+# as Chrome trace events (chrome://tracing, Perfetto, speedscope) or as collapsed stacks (flamegraph.pl).
+# OLYMPIC_PROFILE=trace.json (or .folded) profiles a whole script and writes the trace at exit.
+# Memory peaks come from the process-wide tracemalloc counter, so they are approximate for threaded code.
+
+_active = None  # the Trace being recorded, None when profiling is off
+
+
+def _rows(value):
+    """Rows of a frame, series or array; total rows of a dict of them; None for anything else."""
+    if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(value)
+    if isinstance(value, dict):
+        counts = [_rows(item) for item in value.values()]
+        counts = [count for count in counts if count is not None]
+        return sum(counts) if counts else None
+    return None
+
+
+def _rows_in(args, kwargs):
+    for value in (*args, *kwargs.values()):
+        rows = _rows(value)
+        if rows is not None:
+            return rows
+    return None
+
+
+class _NullSpan:
+    """Stand-in for stage() when profiling is off."""
+
+    rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("trace", "name", "rows_in", "rows_out", "start", "children", "base", "peak")
+
+    def __init__(self, trace, name, rows_in=None):
+        self.trace, self.name, self.rows_in, self.rows_out = trace, name, rows_in, None
+        self.children, self.peak = 0, 0
+
+    def __enter__(self):
+        stack = self.trace._stack()
+        if self.trace.memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)  # the parent's peak so far, before the reset
+            tracemalloc.reset_peak()
+            self.base = current
+        stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        end = time.perf_counter_ns()
+        stack = self.trace._stack()
+        stack.pop()
+        duration = end - self.start
+
+        peak_mb = None
+        if self.trace.memory and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], self.peak)
+            peak_mb = (peak - self.base) / 1024 ** 2
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+        if stack:
+            stack[-1].children += duration
+
+        self.trace.events.append({
+            "name": self.name,
+            "stack": [span.name for span in stack] + [self.name],
+            "thread": threading.get_ident(),
+            "start_us": (self.start - self.trace.origin) / 1000,
+            "duration_us": duration / 1000,
+            "self_us": (duration - self.children) / 1000,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "peak_mb": peak_mb,
+            "error": exc_type.__name__ if exc_type else None,
+        })
+        return False
+
+
+class Trace:
+    """
+    Calls recorded while profiling is on, in the order they finished.
+
+    >>> @profiled
+    ... def double(df):
+    ...     return pd.concat([df, df])
+    >>> with profiling() as trace:
+    ...     _ = double(pd.DataFrame({'a': [1, 2, 3]}))
+    >>> trace.summary()[['calls', 'rows_in', 'rows_out']]  # doctest: +NORMALIZE_WHITESPACE
+                      calls  rows_in  rows_out
+    name
+    Profiling.double      1        3         6
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.owns_tracemalloc = False  # True when enable() started tracemalloc for this trace
+        self.events = []  # list.append is atomic, so threads can share it
+        self.origin = time.perf_counter_ns()
+        self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, name, rows_in=None):
+        return _Span(self, name, rows_in)
+
+    def summary(self):
+        """
+        One row per function or stage: calls, total and self time (ms), rows and largest memory peak.
+
+        :return: DataFrame indexed by name, sorted by total time
+        """
+        events = pd.DataFrame(self.events, columns=["name", "duration_us", "self_us", "rows_in", "rows_out",
+                                                    "peak_mb"])
+        summary = events.groupby("name", sort=False).agg(
+            calls=("name", "size"),
+            total_ms=("duration_us", lambda us: us.sum() / 1000),
+            self_ms=("self_us", lambda us: us.sum() / 1000),
+            rows_in=("rows_in", "max"),
+            rows_out=("rows_out", "max"),
+            peak_mb=("peak_mb", "max"),
+        )
+        return summary.sort_values("total_ms", ascending=False)
+
+    def to_json(self, path=None):
+        """The raw records as JSON; written to path when given, returned otherwise."""
+        return _write(json.dumps({"memory": self.memory, "events": self.events}, indent=1), path)
+
+    def to_chrome_trace(self, path=None):
+        """
+        Chrome trace event format ('X' complete events): open in chrome://tracing, ui.perfetto.dev or speedscope.
+        """
+        threads = {thread: number for number, thread in enumerate(dict.fromkeys(e["thread"] for e in self.events))}
+        trace_events = [{
+            "name": event["name"],
+            "cat": event["name"].split(".")[0],
+            "ph": "X",
+            "ts": event["start_us"],
+            "dur": event["duration_us"],
+            "pid": os.getpid(),
+            "tid": threads[event["thread"]],
+            "args": {key: event[key] for key in ("rows_in", "rows_out", "peak_mb", "error")
+                     if event[key] is not None},
+        } for event in self.events]
+        return _write(json.dumps({"traceEvents": trace_events, "displayTimeUnit": "ms"}), path)
+
+    def to_collapsed(self, path=None):
+        """
+        Collapsed stacks ('outer;inner <self microseconds>' per line) for flamegraph.pl or speedscope.
+        """
+        totals = {}
+        for event in self.events:
+            key = ";".join(event["stack"])
+            totals[key] = totals.get(key, 0) + event["self_us"]
+        return _write("".join(f"{key} {round(us)}\n" for key, us in totals.items()), path)
+
+
+def _write(text, path):
+    if path is None:
+        return text
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as file:
+        file.write(text)
+    return path
+
+
+def profiled(func=None, *, name=None):
+    """
+    Decorator recording every call of func while profiling is on.
+
+    :param func: function to wrap
+    :param name: label in the trace (default: 'module.qualname')
+    """
+    def decorate(func):
+        label = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            trace = _active
+            if trace is None:
+                return func(*args, **kwargs)
+            with trace.span(label, _rows_in(args, kwargs)) as span:
+                result = func(*args, **kwargs)
+                span.rows_out = _rows(result)
+            return result
+        return wrapper
+
+    return decorate if func is None else decorate(func)
+
+
+def stage(name, rows_in=None):
+    """
+    Context manager recording a block (e.g. the pd.read_csv call of a loader) while profiling is on.
+
+    :param name: label in the trace
+    :param rows_in: optional row count of the block's input; set .rows_out on the returned span for the output
+    """
+    trace = _active
+    return _null_span if trace is None else trace.span(name, rows_in)
+
+
+def enable(memory=False):
+    """
+    Start recording into a new Trace (see profiling for the with-statement form).
+
+    :param memory: also record the tracemalloc peak of every call (slower)
+    :return: Trace
+    """
+    global _active
+    trace = Trace(memory)
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        trace.owns_tracemalloc = True
+    _active = trace
+    return trace
+
+
+def disable():
+    """
+    Stop recording; tracemalloc is only stopped when this trace started it.
+
+    :return: the Trace recorded so far, or None when profiling was off
+    """
+    global _active
+    trace, _active = _active, None
+    if trace is not None and trace.owns_tracemalloc and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return trace
+
+
+class profiling:
+    """
+    Record every @profiled call and stage() inside the with block.
+
+    :param memory: also record the tracemalloc peak of every call (slower)
+
+    >>> with profiling() as trace:
+    ...     with stage('load') as span:
+    ...         span.rows_out = 10
+    >>> [(event['name'], event['rows_out']) for event in trace.events]
+    [('load', 10)]
+    >>> with profiling(memory=True) as outer:
+    ...     with profiling(memory=True) as inner:
+    ...         pass
+    ...     tracemalloc.is_tracing()
+    True
+    >>> tracemalloc.is_tracing()
+    False
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+
+    def __enter__(self):
+        self.previous = _active
+        return enable(self.memory)
+
+    def __exit__(self, *exc):
+        global _active
+        disable()
+        _active = self.previous
+        return False
+
+
+def _profile_script(path):
+    """OLYMPIC_PROFILE=path: profile the whole process and write the trace at exit."""
+    trace = enable(memory=os.environ.get("OLYMPIC_PROFILE_MEMORY", "0") == "1")
+
+    def dump():
+        if path.endswith((".folded", ".txt")):
+            trace.to_collapsed(path)
+        else:
+            trace.to_chrome_trace(path)
+        print(f"Profile written to {path}")
+
+    atexit.register(dump)
+
+
+if os.environ.get("OLYMPIC_PROFILE"):
+    _profile_script(os.environ["OLYMPIC_PROFILE"])
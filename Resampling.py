@@ -0,0 +1,196 @@
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from BetweenCountry import batched_correlation, predefined_combinations
+
+
+# Bootstrap confidence intervals and permutation p-values for the host-year correlations.
+# All resamples of one chunk are drawn as a single index array and their correlation matrices
+# come out of one batched_correlation call; chunks can optionally be spread over a process pool.
+
+RESAMPLES_PER_CHUNK = 1000  # fixed chunk size, so results only depend on the seed, not on n_jobs
+
+
+def _seed_sequence(seed):
+    return seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+
+def _resample_chunk(values, n_resamples, method, seed_sequence):
+    """
+    Correlation matrices of n_resamples bootstrap or permutation resamples of values (n_obs, n_metrics).
+    """
+    rng = np.random.default_rng(seed_sequence)
+    n_obs, n_metrics = values.shape
+    if method == "bootstrap":
+        rows = rng.integers(0, n_obs, size=(n_resamples, n_obs))
+        resamples = values[rows]  # (resamples, n_obs, n_metrics)
+    elif method == "permutation":
+        # shuffle every metric independently, which breaks all pairwise associations at once
+        order = np.argsort(rng.random((n_resamples, n_obs, n_metrics)), axis=1)
+        resamples = np.take_along_axis(np.broadcast_to(values, order.shape), order, axis=1)
+    else:
+        raise ValueError("method must be 'bootstrap' or 'permutation'.")
+    return batched_correlation(resamples)
+
+
+def resample_correlations(values, n_resamples=5000, method="bootstrap", seed=None, n_jobs=None):
+    """
+    Correlation matrices of many resamples of one observation table.
+
+    :param values: Array (n_obs, n_metrics), NaN for missing values
+    :param n_resamples: Number of resamples
+    :param method: 'bootstrap' (rows drawn with replacement) or 'permutation' (each column shuffled)
+    :param seed: Seed for numpy's default_rng (int, SeedSequence or None)
+    :param n_jobs: Number of processes; None or 1 computes in this process
+    :return: Array (n_resamples, n_metrics, n_metrics)
+
+    >>> import numpy as np
+    >>> values = np.array([[1.0, 2.0], [2.0, 3.0], [3.0, 5.0], [4.0, 4.0], [5.0, 6.0]])
+    >>> resample_correlations(values, n_resamples=2500, seed=0).shape
+    (2500, 2, 2)
+    """
+    values = np.asarray(values, dtype="float64")
+    chunk_sizes = [RESAMPLES_PER_CHUNK] * (n_resamples // RESAMPLES_PER_CHUNK)
+    if n_resamples % RESAMPLES_PER_CHUNK:
+        chunk_sizes.append(n_resamples % RESAMPLES_PER_CHUNK)
+    seeds = _seed_sequence(seed).spawn(len(chunk_sizes))
+    jobs = [(values, size, method, seed_sequence) for size, seed_sequence in zip(chunk_sizes, seeds)]
+
+    if n_jobs is None or n_jobs == 1 or len(jobs) == 1:
+        chunks = [_resample_chunk(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            chunks = list(executor.map(_resample_chunk, *zip(*jobs)))
+    return np.concatenate(chunks) if chunks else np.empty((0, values.shape[1], values.shape[1]))
+
+
+def correlation_confidence(values, n_resamples=5000, confidence=0.95, seed=None, n_jobs=None):
+    """
+    Point estimate, bootstrap percentile interval and two-sided permutation p-value for every metric pair.
+
+    :param values: Array (n_obs, n_metrics), NaN for missing values
+    :param n_resamples: Number of bootstrap resamples, and of permutations
+    :param confidence: Confidence level of the interval
+    :param seed: Seed for numpy's default_rng (int, SeedSequence or None)
+    :param n_jobs: Number of processes; None or 1 computes in this process
+    :return: dict of (n_metrics, n_metrics) arrays: 'Correlation', 'CI Lower', 'CI Upper', 'P Value'
+
+    >>> import numpy as np
+    >>> values = np.array([[1.0, 2.0], [2.0, 3.0], [3.0, 5.0], [4.0, 4.0], [5.0, 6.0], [6.0, 7.5]])
+    >>> result = correlation_confidence(values, n_resamples=2000, seed=1)
+    >>> round(float(result['Correlation'][0, 1]), 3)
+    0.944
+    >>> bool(result['CI Lower'][0, 1] < result['Correlation'][0, 1] < result['CI Upper'][0, 1])
+    True
+    >>> bool(result['P Value'][0, 1] < 0.05)
+    True
+    >>> import warnings
+    >>> with warnings.catch_warnings():
+    ...     warnings.simplefilter('error')  # a constant metric has no interval, and no warning either
+    ...     result = correlation_confidence(np.c_[values, np.ones(6)], n_resamples=200, seed=1)
+    >>> result['CI Lower'][0, 2], result['P Value'][0, 2]
+    (np.float64(nan), np.float64(nan))
+    """
+    values = np.asarray(values, dtype="float64")
+    estimate = batched_correlation(values)
+    seeds = _seed_sequence(seed).spawn(2)
+    bootstrap = resample_correlations(values, n_resamples, "bootstrap", seeds[0], n_jobs)
+    permutation = resample_correlations(values, n_resamples, "permutation", seeds[1], n_jobs)
+
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings(), np.errstate(invalid="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)  # 'All-NaN slice': pairs without any valid resample
+        lower, upper = np.nanpercentile(bootstrap, [100 * alpha, 100 * (1 - alpha)], axis=0)
+        extreme = (np.abs(permutation) >= np.abs(estimate) - 1e-12).sum(axis=0)
+    # permutations with an undefined correlation (a constant shuffled window) count neither way
+    valid = np.isfinite(permutation).sum(axis=0)
+    p_value = (extreme + 1) / (valid + 1)
+    p_value = np.where(np.isnan(estimate), np.nan, p_value)
+    return {"Correlation": estimate, "CI Lower": lower, "CI Upper": upper, "P Value": p_value}
+
+
+def predefined_correlation_intervals(merged_data, combinations=None, countries=None, n_resamples=5000,
+                                     confidence=0.95, seed=None, n_jobs=None):
+    """
+    Confidence intervals and p-values for every predefined pair and country
+    (the values plotted by plot_predefined_combinations_bar).
+
+    :param merged_data: DataFrame with '{metric}_{suffix}' columns.
+    :param combinations: Dictionary of predefined combinations (default: predefined_combinations).
+    :param countries: Dictionary of country name -> suffix (default: {'Australia': '_AUS', 'China': '_CHI'}).
+    :param n_resamples: Number of bootstrap resamples and permutations per pair.
+    :param confidence: Confidence level of the interval.
+    :param seed: Seed for numpy's default_rng (int, SeedSequence or None).
+    :param n_jobs: Number of processes; None or 1 computes in this process.
+    :return: DataFrame with Combination, Country, N, Correlation, CI Lower, CI Upper, P Value.
+    """
+    combinations = predefined_combinations if combinations is None else combinations
+    countries = {"Australia": "_AUS", "China": "_CHI"} if countries is None else countries
+    pairs = [(combination["metrics"], country, suffix)
+             for combination in combinations.values() for country, suffix in countries.items()]
+    seeds = _seed_sequence(seed).spawn(len(pairs))
+
+    rows = []
+    for ((metric1, metric2), country, suffix), pair_seed in zip(pairs, seeds):
+        columns = [f"{metric1}{suffix}", f"{metric2}{suffix}"]
+        if not set(columns) <= set(merged_data.columns):
+            print(f"Missing: {columns[0]} or {columns[1]} in {suffix.replace('_', '')}")
+            continue
+        values = merged_data[columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype="float64")
+        result = correlation_confidence(values, n_resamples, confidence, pair_seed, n_jobs)
+        rows.append({
+            "Combination": f"{metric1} vs {metric2}",
+            "Country": country,
+            "N": int((~np.isnan(values)).all(axis=1).sum()),
+            **{name: array[0, 1] for name, array in result.items()},
+        })
+    return pd.DataFrame(rows, columns=["Combination", "Country", "N", "Correlation", "CI Lower", "CI Upper",
+                                       "P Value"])
+
+
+def group_correlation_intervals(merged_data, metric_groups, country_suffix, time_period=(-5, 5),
+                                n_resamples=5000, confidence=0.95, seed=None, n_jobs=None):
+    """
+    Confidence intervals and p-values for every pair of every group matrix
+    (the matrices of compute_country_correlation_matrices).
+
+    :param merged_data: DataFrame with merged country metrics.
+    :param metric_groups: Dictionary of metric groups and their metrics.
+    :param country_suffix: Dictionary mapping country names to their column suffixes.
+    :param time_period: Tuple (start, end) to filter by Relative Year.
+    :param n_resamples: Number of bootstrap resamples and permutations per matrix.
+    :param confidence: Confidence level of the interval.
+    :param seed: Seed for numpy's default_rng (int, SeedSequence or None).
+    :param n_jobs: Number of processes; None or 1 computes in this process.
+    :return: DataFrame with Country, Group, Metric 1, Metric 2, Correlation, CI Lower, CI Upper, P Value.
+    """
+    if time_period:
+        merged_data = merged_data[merged_data["Relative Year"].between(*time_period)]
+
+    tasks = [(country, suffix, group, metrics)
+             for country, suffix in country_suffix.items() for group, metrics in metric_groups.items()]
+    seeds = _seed_sequence(seed).spawn(len(tasks))
+
+    rows = []
+    for (country, suffix, group, metrics), group_seed in zip(tasks, seeds):
+        metrics = [metric for metric in metrics if f"{metric}{suffix}" in merged_data.columns]
+        if len(metrics) < 2:
+            print(f"Not enough data for {group} metrics in {country}.")
+            continue
+        values = merged_data[[f"{metric}{suffix}" for metric in metrics]] \
+            .apply(pd.to_numeric, errors="coerce").to_numpy(dtype="float64")
+        result = correlation_confidence(values, n_resamples, confidence, group_seed, n_jobs)
+        for i in range(len(metrics)):
+            for j in range(i + 1, len(metrics)):
+                rows.append({
+                    "Country": country,
+                    "Group": group,
+                    "Metric 1": metrics[i],
+                    "Metric 2": metrics[j],
+                    **{name: array[i, j] for name, array in result.items()},
+                })
+    return pd.DataFrame(rows, columns=["Country", "Group", "Metric 1", "Metric 2", "Correlation", "CI Lower",
+                                       "CI Upper", "P Value"])